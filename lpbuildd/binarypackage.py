@@ -18,6 +18,7 @@ from debian.deb822 import (
     )
 from debian.debian_support import Version
 
+from lpbuildd.buildlog import read_build_log_tail
 from lpbuildd.debian import (
     DebianBuildManager,
     DebianBuildState,
@@ -393,12 +394,9 @@ class BinaryPackageBuildManager(DebianBuildManager):
             # Check the last 4KiB for the Fail-Stage. If it failed
             # during install-deps, search for the missing dependency
             # string.
-            with open(os.path.join(self._cachepath, "buildlog"), "rb") as log:
-                try:
-                    log.seek(-4096, os.SEEK_END)
-                except IOError:
-                    pass
-                tail = log.read(4096).decode("UTF-8", "replace")
+            self._builder.flushLog()
+            tail = read_build_log_tail(self._cachepath, 4096).decode(
+                "UTF-8", "replace")
             if re.search(r"^Fail-Stage: install-deps$", tail, re.M):
                 for rx in BuildLogRegexes.MAYBEDEPFAIL:
                     log_patterns.append([rx, re.M | re.S])
@@ -10,36 +10,151 @@ from __future__ import print_function
 
 __metaclass__ = type
 
+import fcntl
 from functools import partial
 import hashlib
+import io
 import json
+from multiprocessing.pool import ThreadPool
 import os
 import re
 import shutil
+import signal
+import socket
 import sys
 import tempfile
+import threading
 
-import apt
 import six
+from six.moves.configparser import (
+    NoOptionError,
+    NoSectionError,
+    )
+from six.moves.urllib.error import HTTPError
 from six.moves.urllib.request import (
     build_opener,
     HTTPBasicAuthHandler,
     HTTPPasswordMgrWithDefaultRealm,
+    Request,
     urlopen,
     )
 from six.moves.xmlrpc_client import Binary
-from twisted.internet import protocol
+from twisted.internet import (
+    defer,
+    protocol,
+    threads,
+    )
 from twisted.internet import reactor as default_reactor
 from twisted.internet import process
+from twisted.internet.endpoints import (
+    connectProtocol,
+    UNIXClientEndpoint,
+    )
+from twisted.internet.error import (
+    ConnectingCancelledError,
+    ConnectionDone,
+    ProcessDone,
+    ProcessTerminated,
+    )
+from twisted.internet.task import LoopingCall
 from twisted.python import log
-from twisted.web import xmlrpc
-
+from twisted.python.failure import Failure
+from twisted.python.threadable import isInIOThread
+from twisted.web import (
+    http,
+    resource,
+    xmlrpc,
+    )
+from twisted.web.client import (
+    Agent,
+    FileBodyProducer,
+    )
+from twisted.web.http_headers import Headers
+
+from lpbuildd.buildlog import (
+    BufferedLogWriter,
+    GzipLogFile,
+    GzipLogReader,
+    LogSanitizer,
+    LogTail,
+    )
+from lpbuildd.filecache import (
+    CacheFileWriter,
+    FileCache,
+    parse_size,
+    )
 from lpbuildd.target.backend import make_backend
-from lpbuildd.util import shell_escape
+from lpbuildd.target.helper import (
+    FrameDecoder,
+    pack_frame,
+    )
+from lpbuildd.util import (
+    get_installed_version,
+    shell_escape,
+    )
 
 
 devnull = open("/dev/null", "r")
 
+# ioctl to make a file share another file's data (see ioctl_ficlone(2)).
+FICLONE = 0x40049409
+
+
+# This regular expression will be used to remove authentication
+# credentials from URLs.
+_password_re = re.compile(br'://([^:]*:[^@]+@)(\S+)')
+# Builder proxy passwords are UUIDs.
+_proxy_auth_re = re.compile(br',proxyauth=[^:]+:[A-Za-z0-9-]+')
+
+
+def _sanitizeLine(line):
+    """Delete URL passwords from a single line, which may be a hit."""
+    line = _password_re.sub(br'://\2', line)
+    return _proxy_auth_re.sub(b'', line)
+
+
+def _sanitizeBuffer(data):
+    """Delete URL passwords from a buffer containing many lines.
+
+    Almost no lines contain credentials, so rather than running the
+    regular expressions over every line, this scans for fixed strings that
+    any match must contain ("@" after "://", or ",proxyauth=") and only
+    runs them on the lines containing those strings.
+
+    :param data: A byte string.
+    :return: The sanitized byte string.
+    """
+    at_pos = data.find(b'@')
+    proxy_pos = data.find(b',proxyauth=')
+    if at_pos == -1 and proxy_pos == -1:
+        return data
+    parts = []
+    done = 0
+    while at_pos != -1 or proxy_pos != -1:
+        if at_pos == -1 or (proxy_pos != -1 and proxy_pos < at_pos):
+            hit = proxy_pos
+        else:
+            hit = at_pos
+        line_start = data.rfind(b'\n', done, hit) + 1
+        if line_start == 0:
+            line_start = done
+        line_end = data.find(b'\n', hit)
+        if line_end == -1:
+            line_end = len(data)
+        if hit == proxy_pos or data.find(b'://', line_start, hit) != -1:
+            parts.append(data[done:line_start])
+            parts.append(_sanitizeLine(data[line_start:line_end]))
+            done = line_end
+            if at_pos != -1:
+                at_pos = data.find(b'@', line_end)
+            if proxy_pos != -1 and proxy_pos < line_end:
+                proxy_pos = data.find(b',proxyauth=', line_end)
+        else:
+            # An "@" that isn't preceded by "://" on the same line.
+            at_pos = data.find(b'@', hit + 1)
+    parts.append(data[done:])
+    return b''.join(parts)
+
 
 def _sanitizeURLs(bytes_seq):
     """A generator that deletes URL passwords from a bytes sequence.
@@ -50,16 +165,10 @@ def _sanitizeURLs(bytes_seq):
     :param bytes_seq: A sequence of byte strings (that may contain URLs).
     :return: A (sanitized) line stripped of authentication credentials.
     """
-    # This regular expression will be used to remove authentication
-    # credentials from URLs.
-    password_re = re.compile(br'://([^:]*:[^@]+@)(\S+)')
-    # Builder proxy passwords are UUIDs.
-    proxy_auth_re = re.compile(br',proxyauth=[^:]+:[A-Za-z0-9-]+')
-
     for line in bytes_seq:
-        sanitized_line = password_re.sub(br'://\2', line)
-        sanitized_line = proxy_auth_re.sub(b'', sanitized_line)
-        yield sanitized_line
+        if b'@' in line or b',proxyauth=' in line:
+            line = _sanitizeLine(line)
+        yield line
 
 
 # XXX cprov 2005-06-28:
@@ -71,10 +180,13 @@ def _sanitizeURLs(bytes_seq):
 class RunCapture(protocol.ProcessProtocol):
     """Run a command and capture its output to a builder's log."""
 
-    def __init__(self, builder, callback, stdin=None):
+    def __init__(self, builder, callback, stdin=None, direct_log=False):
         self.builder = builder
         self.notify = callback
         self.stdin = stdin
+        # True if the process writes straight to the build log (see
+        # `Builder.startDirectLog`).
+        self.direct_log = direct_log
         self.builderFailCall = None
         self.ignore = False
 
@@ -101,6 +213,10 @@ class RunCapture(protocol.ProcessProtocol):
         "builderFail", and invoke the programmed notification callback.  The
         notification callback must be invoked last.
         """
+        if self.direct_log:
+            self.builder.stopDirectLog()
+            self.direct_log = False
+
         if self.ignore:
             # The build manager no longer cares about this process.
             return
@@ -114,6 +230,151 @@ class RunCapture(protocol.ProcessProtocol):
             self.notify(statusobject.value.exitCode)
 
 
+class TargetHelperProtocol(protocol.Protocol):
+    """Run an operation using a build's in-target helper.
+
+    This stands in for the process transport of a `RunCapture`, so that
+    the build manager can treat the operation like any other subprocess.
+    See `lpbuildd.target.helper` for the protocol.
+    """
+
+    def __init__(self, capture, args, stdin=None):
+        self.capture = capture
+        self.args = args
+        self.stdin = stdin
+        self._decoder = FrameDecoder()
+        self._result = {}
+        self._pending = []
+        self._connecting = None
+        self._ended = False
+        capture.transport = self
+
+    def connect(self, endpoint):
+        """Connect to the helper and ask it to run the operation.
+
+        :return: A `Deferred` that fires once connected.
+        """
+        def connected(result):
+            self._connecting = None
+            return result
+
+        self._connecting = connectProtocol(endpoint, self)
+        return self._connecting.addBoth(connected)
+
+    def connectionMade(self):
+        self.transport.write(
+            pack_frame(b"R", json.dumps({"args": self.args}).encode("UTF-8")) +
+            pack_frame(b"I", self.stdin or b""))
+        for frame in self._pending:
+            self.transport.write(frame)
+        self._pending = []
+
+    def dataReceived(self, data):
+        for kind, payload in self._decoder.feed(data):
+            if kind == b"O":
+                self.capture.outReceived(payload)
+            elif kind == b"X":
+                self._result = json.loads(payload.decode("UTF-8"))
+
+    def connectionLost(self, reason):
+        self._ended = True
+        if self._result.get("exit_code") == 0:
+            status = ProcessDone(0)
+        else:
+            status = ProcessTerminated(
+                exitCode=self._result.get("exit_code"),
+                signal=self._result.get("signal"))
+        self.capture.processEnded(Failure(status))
+
+    def signalProcess(self, signal_id):
+        """Send a signal to the operation, like `IProcessTransport`."""
+        if self._ended:
+            raise process.ProcessExitedAlready()
+        if not isinstance(signal_id, int):
+            signal_id = getattr(signal, "SIG%s" % signal_id)
+        frame = pack_frame(b"K", str(signal_id).encode("UTF-8"))
+        if self.transport is None:
+            self._pending.append(frame)
+        else:
+            self.transport.write(frame)
+
+    def loseConnection(self):
+        """Stop running the operation, like `IProcessTransport`.
+
+        If we haven't connected to the helper yet, then give up on doing so
+        and report the operation as having been killed.
+        """
+        if self.transport is not None:
+            self.transport.loseConnection()
+        elif self._connecting is not None and not self._ended:
+            self._connecting.cancel()
+            self.connectionLost(Failure(ConnectionDone()))
+
+
+class TargetHelper:
+    """A long-lived in-target process that runs operations for a build.
+
+    See `lpbuildd.target.helper`.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._tempdir = None
+        self._process = None
+        self._ended = None
+
+    @property
+    def socket_path(self):
+        return os.path.join(self._tempdir, "socket")
+
+    def start(self, args):
+        """Start the helper.
+
+        :param args: Arguments for in-target, excluding the operation.
+        """
+        self._tempdir = tempfile.mkdtemp(prefix="in-target-helper.")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            listener.bind(self.socket_path)
+            listener.listen(16)
+            self._ended = defer.Deferred()
+            self._process = RunCapture(
+                self.manager._builder, self._ended.callback)
+            self.manager._reactor.spawnProcess(
+                self._process, self.manager._intargetpath,
+                [args[0], "serve-operations"] + args[1:], env=None,
+                path=self.manager.home,
+                childFDs={0: "w", 1: "r", 2: "r", 3: listener.fileno()})
+        finally:
+            listener.close()
+
+    def run(self, capture, args, stdin=None):
+        """Ask the helper to run an operation.
+
+        :param capture: The `RunCapture` to receive output and the exit
+            status.
+        :param args: Arguments for in-target, excluding the program name.
+        :return: A `Deferred` that fires once connected to the helper.
+        """
+        endpoint = UNIXClientEndpoint(self.manager._reactor, self.socket_path)
+        return TargetHelperProtocol(capture, args, stdin=stdin).connect(
+            endpoint)
+
+    def stop(self):
+        """Stop the helper once any running operations have finished.
+
+        :return: A `Deferred` that fires when the helper has exited.
+        """
+        if self._process is not None and self._process.transport is not None:
+            self._process.transport.closeStdin()
+        self._process = None
+        if self._tempdir is not None:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+            self._tempdir = None
+        ended, self._ended = self._ended, None
+        return ended if ended is not None else defer.succeed(None)
+
+
 def get_build_path(home, build_id, *extra):
     """Generate a path within the build directory.
 
@@ -147,35 +408,60 @@ class BuildManager(object):
         self._preppath = os.path.join(self._bin, "builder-prep")
         self._intargetpath = os.path.join(self._bin, "in-target")
         self._subprocess = None
+        # If enabled, in-target operations are run by a long-lived helper
+        # process rather than by starting in-target afresh each time.
+        try:
+            self._use_target_helper = builder._config.get(
+                "intarget", "helper").lower() in ("1", "yes", "true", "on")
+        except (NoSectionError, NoOptionError):
+            self._use_target_helper = False
+        self._target_helper = None
         self._reaped_states = set()
         self.is_archive_private = False
         self.home = os.environ['HOME']
         self.abort_timeout = 120
         self.status_path = get_build_path(self.home, self._buildid, "status")
         self._final_extra_status = None
+        # The identity of the extra status file when it was last read, and
+        # its parsed contents.
+        self._extra_status_cache = (None, {})
+        # Names of files in the builder's cache used by this build.
+        self.cache_files = set()
 
     @property
     def needs_sanitized_logs(self):
         return self.is_archive_private
 
-    def runSubProcess(self, command, args, iterate=None, stdin=None, env=None):
-        """Run a subprocess capturing the results in the log."""
-        if iterate is None:
-            iterate = self.iterate
-        self._subprocess = RunCapture(self._builder, iterate, stdin=stdin)
+    def _logCommand(self, command, args):
         text_args = [
             arg.decode("UTF-8", "replace") if isinstance(arg, bytes) else arg
             for arg in args[1:]]
         self._builder.log("RUN: %s %s\n" % (
             command, " ".join(shell_escape(arg) for arg in text_args)))
-        childfds = {
-            0: devnull.fileno() if stdin is None else "w",
-            1: "r",
-            2: "r",
-            }
-        self._reactor.spawnProcess(
-            self._subprocess, command, args, env=env,
-            path=self.home, childFDs=childfds)
+
+    def runSubProcess(self, command, args, iterate=None, stdin=None, env=None):
+        """Run a subprocess capturing the results in the log."""
+        if iterate is None:
+            iterate = self.iterate
+        self._logCommand(command, args)
+        log_fd = self._builder.startDirectLog()
+        try:
+            self._subprocess = RunCapture(
+                self._builder, iterate, stdin=stdin,
+                direct_log=log_fd is not None)
+            childfds = {
+                0: devnull.fileno() if stdin is None else "w",
+                1: "r" if log_fd is None else log_fd,
+                2: "r" if log_fd is None else log_fd,
+                }
+            self._reactor.spawnProcess(
+                self._subprocess, command, args, env=env,
+                path=self.home, childFDs=childfds)
+        except Exception:
+            # No process was started, so RunCapture won't stop this.
+            if log_fd is not None:
+                self._builder.stopDirectLog()
+            raise
 
     def runTargetSubProcess(self, command, *args, **kwargs):
         """Run a subprocess that operates on the target environment."""
@@ -187,8 +473,52 @@ class BuildManager(object):
             "--arch=%s" % self.arch_tag,
             self._buildid,
             ]
-        self.runSubProcess(
-            self._intargetpath, base_args + list(args), **kwargs)
+        if self._use_target_helper:
+            self.runTargetHelperProcess(base_args, list(args), **kwargs)
+        else:
+            self.runSubProcess(
+                self._intargetpath, base_args + list(args), **kwargs)
+
+    def runTargetHelperProcess(self, base_args, args, iterate=None,
+                               stdin=None):
+        """Run an in-target operation using the build's helper process.
+
+        If the helper can't be reached, run in-target directly instead.
+        """
+        if iterate is None:
+            iterate = self.iterate
+        if self._target_helper is None:
+            self._target_helper = TargetHelper(self)
+            self._target_helper.start(base_args[:1] + base_args[2:])
+        args = base_args + args
+        self._logCommand(self._intargetpath, args)
+        self._subprocess = RunCapture(self._builder, iterate)
+        d = self._target_helper.run(self._subprocess, args[1:], stdin=stdin)
+
+        def fall_back(failure):
+            if failure.check(
+                    defer.CancelledError, ConnectingCancelledError):
+                # The operation was abandoned before it started.
+                return
+            self._builder.log(
+                "in-target helper unavailable (%s); running directly\n" %
+                failure.getErrorMessage())
+            self.stopTargetHelper()
+            self._use_target_helper = False
+            self.runSubProcess(
+                self._intargetpath, args, iterate=iterate, stdin=stdin)
+
+        d.addErrback(fall_back)
+
+    def stopTargetHelper(self):
+        """Stop the build's in-target helper process, if any.
+
+        :return: A `Deferred` that fires when the helper has exited.
+        """
+        helper, self._target_helper = self._target_helper, None
+        if helper is None:
+            return defer.succeed(None)
+        return helper.stop()
 
     def doUnpack(self):
         """Unpack the build chroot."""
@@ -222,11 +552,6 @@ class BuildManager(object):
         if not self.fast_cleanup:
             self.runTargetSubProcess("remove-build")
 
-        # Sanitize the URLs in the buildlog file if this is a build
-        # in a private archive.
-        if self.needs_sanitized_logs:
-            self._builder.sanitizeBuildlog(self._builder.cachePath("buildlog"))
-
         if self.fast_cleanup:
             self.iterate(0, quiet=True)
 
@@ -248,6 +573,13 @@ class BuildManager(object):
         value keyed under the 'archive_private' string. If that value
         evaluates to True the build at hand is for a private archive.
         """
+        # Check whether this is a build in a private archive and
+        # whether the URLs in the buildlog file should be sanitized
+        # so that they do not contain any embedded authentication
+        # credentials.  This must happen before anything is logged.
+        if extra_args.get('archive_private'):
+            self.is_archive_private = True
+
         if 'build_url' in extra_args:
             self._builder.log("%s\n" % extra_args['build_url'])
 
@@ -256,19 +588,14 @@ class BuildManager(object):
             os.symlink(self._builder.cachePath(files[f]),
                        get_build_path(self.home, self._buildid, f))
         self._chroottarfile = self._builder.cachePath(chroot)
+        self.cache_files = set(files.values())
+        self.cache_files.add(chroot)
 
         self.image_type = extra_args.get('image_type', 'chroot')
         self.series = extra_args['series']
         self.arch_tag = extra_args.get('arch_tag', self._builder.getArch())
         self.fast_cleanup = extra_args.get('fast_cleanup', False)
 
-        # Check whether this is a build in a private archive and
-        # whether the URLs in the buildlog file should be sanitized
-        # so that they do not contain any embedded authentication
-        # credentials.
-        if extra_args.get('archive_private'):
-            self.is_archive_private = True
-
         self.backend = make_backend(
             self.backend_name, self._buildid,
             series=self.series, arch=self.arch_tag)
@@ -280,19 +607,32 @@ class BuildManager(object):
 
         This may be used to return manager-specific information from the
         XML-RPC status call.
+
+        The status file is only read again if it has been replaced or
+        modified since the last call, so callers must not modify the
+        returned dictionary.
         """
         if self._final_extra_status is not None:
             return self._final_extra_status
         try:
-            with open(self.status_path) as status_file:
-                return json.load(status_file)
-        except IOError:
-            pass
-        except Exception as e:
-            print(
-                "Error deserialising extra status file: %s" % e,
-                file=sys.stderr)
-        return {}
+            st = os.stat(self.status_path)
+            key = (st.st_ino, st.st_mtime, st.st_size)
+        except OSError:
+            key = None
+        if key != self._extra_status_cache[0]:
+            status = {}
+            if key is not None:
+                try:
+                    with open(self.status_path) as status_file:
+                        status = json.load(status_file)
+                except IOError:
+                    pass
+                except Exception as e:
+                    print(
+                        "Error deserialising extra status file: %s" % e,
+                        file=sys.stderr)
+            self._extra_status_cache = (key, status)
+        return self._extra_status_cache[1]
 
     def iterate(self, success, quiet=False):
         """Perform an iteration of the builder.
@@ -334,6 +674,10 @@ class BuildManager(object):
         else:
             self.alreadyfailed = True
         primary_subprocess = self._subprocess
+        # Reap without the helper, in case it is what is stuck.  Any
+        # operation it is running carries on until the reaper kills it.
+        self.stopTargetHelper()
+        self._use_target_helper = False
         self.abortReap()
         # In extreme cases the build may be hung too badly for
         # scan-for-processes to manage to kill it (blocked on I/O,
@@ -346,6 +690,7 @@ class BuildManager(object):
     def builderFail(self, reason, primary_subprocess):
         """Mark the builder as failed."""
         self._builder.log("ABORTING: %s\n" % reason)
+        self.stopTargetHelper()
         self._subprocess.builderFailCall = None
         self._builder.builderFail()
         self.alreadyfailed = True
@@ -366,13 +711,59 @@ class BuildManager(object):
         self._subprocess.transport.loseConnection()
 
     def addWaitingFileFromBackend(self, path, name=None):
-        fetched_dir = tempfile.mkdtemp()
+        """Add a file in the backend to the cache.
+
+        The file is streamed straight into the cache and hashed on the way,
+        so it is only read once.
+        """
+        if name is None:
+            name = os.path.basename(path)
+        writer = self._builder.openCacheFile()
         try:
-            fetched_path = os.path.join(fetched_dir, os.path.basename(path))
-            self.backend.copy_out(path, fetched_path)
-            self._builder.addWaitingFile(fetched_path, name=name)
-        finally:
-            shutil.rmtree(fetched_dir)
+            self.backend.copy_out_to_sink(path, writer)
+            writer.close()
+        except Exception:
+            writer.discard()
+            raise
+        self._builder.addWaitingCacheFiles({name: writer})
+
+    def addWaitingFilesFromBackend(self, path, filter=None, max_depth=None,
+                                   name=None):
+        """Add regular files in a directory tree in the backend to the cache.
+
+        The files are streamed out of the backend in one go using
+        `Backend.copy_out_tree_to_sinks`, straight into the cache.
+
+        :param path: The directory in the backend to copy files from.
+        :param filter: As for `Backend.copy_out_tree`.
+        :param max_depth: As for `Backend.copy_out_tree`.
+        :param name: If not None, a callable that takes the path of a file
+            relative to `path` and returns the name under which to report
+            it; by default, files are reported under their base names.
+        :return: A list of the names of the files that were added.
+        """
+        if name is None:
+            name = os.path.basename
+        writers = {}
+
+        def open_sink(entry):
+            entry_name = name(entry)
+            if entry_name in writers:
+                # A later file with the same name wins, as with
+                # addWaitingFile.
+                writers[entry_name].discard()
+            writer = writers[entry_name] = self._builder.openCacheFile()
+            return writer
+
+        try:
+            entries = self.backend.copy_out_tree_to_sinks(
+                path, open_sink, filter=filter, max_depth=max_depth)
+        except Exception:
+            for writer in writers.values():
+                writer.discard()
+            raise
+        self._builder.addWaitingCacheFiles(writers)
+        return [name(entry) for entry in entries]
 
 
 class BuilderStatus:
@@ -402,19 +793,205 @@ class BuildStatus:
 class Builder(object):
     """The core of a builder."""
 
-    def __init__(self, config):
+    # Files are only fetched in segments if each segment would be at least
+    # this large.
+    download_segment_min_size = 64 * 1024 * 1024
+
+    def __init__(self, config, reactor=None):
         object.__init__(self)
         self._config = config
-        self.builderstatus = BuilderStatus.IDLE
+        if reactor is None:
+            reactor = default_reactor
+        self._reactor = reactor
+        self._builderstatus = BuilderStatus.IDLE
         self._cachepath = self._config.get("builder", "filecache")
-        self.buildstatus = BuildStatus.OK
+        self._buildstatus = BuildStatus.OK
+        # Incremented whenever the builder status, the build status or the
+        # manager's internal state changes.
+        self.status_serial = 0
+        # Deferreds waiting for the status to change.
+        self._status_waiters = []
+        # An optional URL to POST to when the status changes.
+        try:
+            self._status_hook_url = self._config.get("statushook", "url")
+        except (NoSectionError, NoOptionError):
+            self._status_hook_url = None
+        self._status_agent = None
         self.waitingfiles = {}
         self.builddependencies = ""
         self._log = None
+        self._log_path = self.cachePath("buildlog")
+        self._logtail = None
+        self._log_sanitizer = None
+        # The number of bytes written to the build log so far.
+        self._log_size = 0
+        # A gzip log reader and its position, for readLog.
+        self._log_reader = None
+        # Deferreds waiting for the build log to change.
+        self._log_waiters = []
+        # The number of running subprocesses writing straight to the build
+        # log, the LoopingCall watching the log while there are any, and
+        # the size of the log when it was last checked.
+        self._direct_log_writers = 0
+        self._log_watcher = None
+        self._log_watch_pos = 0
         self.manager = None
+        # Maps SHA-1 checksums of files currently being fetched into the
+        # cache to dictionaries describing the progress of each download.
+        self.downloads = {}
+        # Maps SHA-1 checksums of files currently being fetched into the
+        # cache to lists of Deferreds waiting for those fetches.
+        self._fetches = {}
+        try:
+            self._download_concurrency = int(
+                self._config.get("filecache", "downloadconcurrency"))
+        except (NoSectionError, NoOptionError):
+            self._download_concurrency = 4
+        try:
+            self._download_segments = int(
+                self._config.get("filecache", "downloadsegments"))
+        except (NoSectionError, NoOptionError):
+            self._download_segments = 1
+        try:
+            self._store_mode = self._config.get("filecache", "storemode")
+        except (NoSectionError, NoOptionError):
+            self._store_mode = "copy"
+        try:
+            self._store_concurrency = int(
+                self._config.get("filecache", "storeconcurrency"))
+        except (NoSectionError, NoOptionError):
+            self._store_concurrency = 4
+        try:
+            self._log_flush_size = parse_size(
+                self._config.get("buildlog", "flushsize"))
+        except (NoSectionError, NoOptionError):
+            self._log_flush_size = 64 * 1024
+        try:
+            self._log_flush_interval = float(
+                self._config.get("buildlog", "flushinterval"))
+        except (NoSectionError, NoOptionError):
+            self._log_flush_interval = 1.0
+        # How to mirror build log output to the daemon's own log: "all",
+        # "none", or "sample" to mirror one chunk in every `samplerate`.
+        try:
+            self._log_mirror = self._config.get("buildlog", "mirror")
+        except (NoSectionError, NoOptionError):
+            self._log_mirror = "all"
+        try:
+            self._log_sample_rate = int(
+                self._config.get("buildlog", "samplerate"))
+        except (NoSectionError, NoOptionError):
+            self._log_sample_rate = 100
+        self._log_chunks = 0
+        # How to capture subprocess output: "pipe" to pass it through
+        # `log`, or "direct" to have subprocesses write straight to the
+        # build log where possible.
+        try:
+            self._log_capture = self._config.get("buildlog", "capture")
+        except (NoSectionError, NoOptionError):
+            self._log_capture = "pipe"
+        try:
+            self._log_watch_interval = float(
+                self._config.get("buildlog", "watchinterval"))
+        except (NoSectionError, NoOptionError):
+            self._log_watch_interval = 1.0
+        # How to compress the build log: "gzip", or "none".
+        try:
+            self._log_compression = self._config.get("buildlog", "compress")
+        except (NoSectionError, NoOptionError):
+            self._log_compression = "none"
+        if self._log_compression not in ("gzip", "none"):
+            raise ValueError(
+                "Unsupported build log compression: %s" %
+                self._log_compression)
 
         if not os.path.isdir(self._cachepath):
             raise ValueError("FileCache path is not a dir")
+        try:
+            quota = parse_size(self._config.get("filecache", "quota"))
+        except (NoSectionError, NoOptionError):
+            quota = None
+        try:
+            index_path = self._config.get("filecache", "index")
+        except (NoSectionError, NoOptionError):
+            index_path = None
+        self.filecache = FileCache(
+            self._cachepath, quota=quota, index_path=index_path)
+
+    @property
+    def builderstatus(self):
+        return self._builderstatus
+
+    @builderstatus.setter
+    def builderstatus(self, value):
+        if value != self._builderstatus:
+            self._builderstatus = value
+            self.notifyStatusChange()
+
+    @property
+    def buildstatus(self):
+        return self._buildstatus
+
+    @buildstatus.setter
+    def buildstatus(self, value):
+        if value != self._buildstatus:
+            self._buildstatus = value
+            self.notifyStatusChange()
+
+    def notifyStatusChange(self):
+        """Record that the status has changed, and tell anyone waiting."""
+        self.status_serial += 1
+        waiters, self._status_waiters = self._status_waiters, []
+        for waiter in waiters:
+            waiter.callback(True)
+        if self._status_hook_url is not None:
+            self._postStatusHook()
+
+    def waitForStatusChange(self, serial, timeout):
+        """Wait for the status to change.
+
+        :param serial: The `status_serial` the caller last saw.
+        :param timeout: The maximum number of seconds to wait.
+        :return: A `Deferred` that fires with True as soon as
+            `status_serial` differs from `serial`, or with False if that
+            doesn't happen within `timeout` seconds.
+        """
+        if serial != self.status_serial:
+            return defer.succeed(True)
+        d = defer.Deferred(canceller=self._cancelStatusWaiter)
+        self._status_waiters.append(d)
+        delayed_call = self._reactor.callLater(timeout, d.cancel)
+
+        def timed_out(failure):
+            failure.trap(defer.CancelledError)
+            return False
+
+        def done(result):
+            if delayed_call.active():
+                delayed_call.cancel()
+            return result
+
+        return d.addErrback(timed_out).addBoth(done)
+
+    def _cancelStatusWaiter(self, d):
+        if d in self._status_waiters:
+            self._status_waiters.remove(d)
+
+    def _postStatusHook(self):
+        """POST a summary of the current status to the status hook URL."""
+        if self._status_agent is None:
+            self._status_agent = Agent(self._reactor)
+        body = json.dumps({
+            "status_serial": self.status_serial,
+            "builder_status": self.builderstatus,
+            "build_status": self.buildstatus,
+            "build_id": getattr(self.manager, "_buildid", None),
+            }).encode("UTF-8")
+        d = self._status_agent.request(
+            b"POST", self._status_hook_url.encode("UTF-8"),
+            Headers({b"Content-Type": [b"application/json"]}),
+            FileBodyProducer(io.BytesIO(body)))
+        d.addErrback(log.err, "Failed to POST status hook")
 
     def getArch(self):
         """Return the Architecture tag for the builder."""
@@ -445,74 +1022,453 @@ class Builder(object):
         """Ensure we have the file with the checksum specified.
 
         Optionally you can provide the librarian URL and
-        the builder will fetch the file if it doesn't have it.
-        Return a tuple containing: (<present>, <info>)
+        the builder will fetch the file if it doesn't have it.  Fetching
+        happens in a thread so that it doesn't block the reactor; progress
+        is reported in `downloads`.  Concurrent requests for the same file
+        share a single download.
+
+        :return: A `Deferred` that fires with a tuple containing:
+            (<present>, <info>)
         """
-        extra_info = 'No URL'
         cachefile = self.cachePath(sha1sum)
-        if url is not None:
-            extra_info = 'Cache'
-            if not os.path.exists(cachefile):
-                self.log('Fetching %s by url %s' % (sha1sum, url))
-                if username:
-                    opener = self.setupAuthHandler(
-                        url, username, password).open
+        if self.filecache.isPresent(sha1sum):
+            return defer.succeed((True, 'No URL' if url is None else 'Cache'))
+        if url is None:
+            return defer.succeed((False, 'No URL'))
+
+        waiters = self._fetches.get(sha1sum)
+        if waiters is not None:
+            # Someone else is already fetching this file; wait for them.
+            d = defer.Deferred()
+            waiters.append(d)
+            return d
+
+        self.log('Fetching %s by url %s' % (sha1sum, url))
+        progress = {"downloaded": 0, "size": None}
+        self.downloads[sha1sum] = progress
+        waiters = self._fetches[sha1sum] = []
+
+        def finished(extra_info):
+            self.log(extra_info)
+            present = os.path.exists(cachefile)
+            if present:
+                self.evictCacheFiles(sha1sum)
+            return (present, extra_info)
+
+        def notify(result):
+            del self._fetches[sha1sum]
+            self.downloads.pop(sha1sum, None)
+            for waiter in waiters:
+                if isinstance(result, Failure):
+                    waiter.errback(result)
                 else:
-                    opener = urlopen
+                    waiter.callback(result)
+            return result
+
+        d = threads.deferToThread(
+            self._fetchToCache, sha1sum, url, username, password, progress)
+        d.addCallback(finished)
+        d.addBoth(notify)
+        return d
+
+    def ensurePresentMany(self, files):
+        """Ensure we have several files, fetching them concurrently.
+
+        At most `[filecache] downloadconcurrency` files are fetched at once.
+
+        :param files: A sequence of (sha1sum, url, username, password)
+            tuples.
+        :return: A `Deferred` that fires with a list of (<present>, <info>)
+            tuples, one for each element of `files` in the same order.
+        """
+        semaphore = defer.DeferredSemaphore(self._download_concurrency)
+
+        def failed(failure):
+            return (False, 'Error fetching file: %s' % failure.value)
+
+        return defer.gatherResults([
+            semaphore.run(self.ensurePresent, *f).addErrback(failed)
+            for f in files])
+
+    def _openURL(self, url, username=None, password=None, start=None,
+                 end=None, method=None):
+        """Open a URL, optionally requesting only a range of bytes.
+
+        :param start: If not None, request bytes from this offset onwards.
+        :param end: If not None, request bytes up to and including this
+            offset.
+        :param method: If not None, use this HTTP method rather than GET.
+        :return: A file-like response object.
+        """
+        request = Request(url)
+        if start is not None:
+            request.add_header(
+                "Range", "bytes=%d-%s" % (start, "" if end is None else end))
+        if method is not None:
+            request.get_method = lambda: method
+        if username:
+            opener = self.setupAuthHandler(url, username, password).open
+        else:
+            opener = urlopen
+        return opener(request)
+
+    def _fetchToCache(self, sha1sum, url, username, password, progress):
+        """Fetch a file into the cache, verifying its checksum.
+
+        Partially-downloaded files are kept so that a later attempt can
+        resume them.  If `[filecache] downloadsegments` is greater than
+        one, large files are fetched as that many ranged segments in
+        parallel.
+
+        This is run in a thread, so it must not touch the build log or any
+        other reactor-owned state apart from `progress`.
+
+        :return: A string describing the outcome.
+        """
+        cachefile = self.cachePath(sha1sum)
+        tmpfile = cachefile + '.tmp'
+        # Don't change this to URLError without thoroughly
+        # testing for regressions. For now, just suppress
+        # the PyLint warnings.
+        # pylint: disable-msg=W0703
+        try:
+            digests = None
+            if self._download_segments > 1 and not os.path.exists(tmpfile):
+                digests = self._fetchSegments(
+                    tmpfile, url, username, password, progress)
+            if digests is None:
+                # Segments left behind by an earlier attempt won't be
+                # resumed now.
+                self._removeSegments(tmpfile)
+                digests = self._fetchResumable(
+                    tmpfile, url, username, password, progress)
+        except Exception as info:
+            return 'Error accessing Librarian: %s' % info
+        sha1_digest, sha256_digest = digests
+        if sha1_digest != sha1sum:
+            os.remove(tmpfile)
+            return "Digests did not match, removing again!"
+        os.rename(tmpfile, cachefile)
+        self.filecache.add(sha1sum, sha256=sha256_digest, url=url)
+        return 'Download'
+
+    def _hashFile(self, path, *check_sums):
+        """Update each of `check_sums` with the contents of `path`."""
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(256*1024), b''):
+                for check_sum in check_sums:
+                    check_sum.update(chunk)
+
+    def _fetchResumable(self, tmpfile, url, username, password, progress):
+        """Fetch a URL into `tmpfile`, resuming any existing partial file.
+
+        :return: A tuple of the SHA-1 and SHA-256 hex digests of the
+            resulting file.
+        """
+        sha1 = hashlib.sha1()
+        sha256 = hashlib.sha256()
+        offset = os.path.getsize(tmpfile) if os.path.exists(tmpfile) else 0
+        try:
+            f = self._openURL(
+                url, username, password, start=offset if offset else None)
+        except HTTPError as e:
+            if not offset or e.code != 416:
+                raise
+            # Range Not Satisfiable: we may already have the whole file.
+            self._hashFile(tmpfile, sha1, sha256)
+            return sha1.hexdigest(), sha256.hexdigest()
+        try:
+            if offset and f.getcode() != 206:
+                # The server ignored our Range header; start again.
+                offset = 0
+            size = f.info().get("Content-Length")
+            if size is not None and size.isdigit():
+                progress["size"] = offset + int(size)
+            if offset:
+                self._hashFile(tmpfile, sha1, sha256)
+            progress["downloaded"] = offset
+            with open(tmpfile, "ab" if offset else "wb") as of:
+                # Upped for great justice to 256k
+                for chunk in iter(lambda: f.read(256*1024), b''):
+                    of.write(chunk)
+                    sha1.update(chunk)
+                    sha256.update(chunk)
+                    progress["downloaded"] += len(chunk)
+        finally:
+            f.close()
+        return sha1.hexdigest(), sha256.hexdigest()
+
+    def _removeSegments(self, tmpfile):
+        """Remove any partial segment files for `tmpfile`."""
+        directory, name = os.path.split(tmpfile)
+        prefix = name + "."
+        for entry in os.listdir(directory):
+            if entry.startswith(prefix) and entry[len(prefix):].isdigit():
+                os.remove(os.path.join(directory, entry))
+
+    def _fetchSegments(self, tmpfile, url, username, password, progress):
+        """Fetch a URL into `tmpfile` as several parallel ranged segments.
+
+        Each segment is fetched into its own partial file, which is
+        resumed by later attempts if the fetch fails.
+
+        :return: A tuple of the SHA-1 and SHA-256 hex digests of the
+            resulting file, or None if the server or the file is unsuitable
+            for segmented fetching.
+        """
+        try:
+            head = self._openURL(url, username, password, method="HEAD")
+        except Exception:
+            return None
+        try:
+            size = head.info().get("Content-Length")
+            accept_ranges = head.info().get("Accept-Ranges")
+        finally:
+            head.close()
+        if accept_ranges != "bytes" or size is None or not size.isdigit():
+            return None
+        size = int(size)
+        segments = self._download_segments
+        if size < segments * self.download_segment_min_size:
+            return None
+
+        progress["size"] = size
+        segment_size = -(-size // segments)
+        parts = []
+        for i in range(segments):
+            start = i * segment_size
+            end = min(start + segment_size, size) - 1
+            parts.append(("%s.%d" % (tmpfile, i), start, end))
+        lock = threading.Lock()
+        errors = []
+
+        def fetch_part(part_path, start, end):
+            try:
+                offset = (
+                    os.path.getsize(part_path) if os.path.exists(part_path)
+                    else 0)
+                with lock:
+                    progress["downloaded"] += offset
+                if start + offset > end:
+                    return
+                f = self._openURL(
+                    url, username, password, start=start + offset, end=end)
                 try:
-                    f = opener(url)
-                # Don't change this to URLError without thoroughly
-                # testing for regressions. For now, just suppress
-                # the PyLint warnings.
-                # pylint: disable-msg=W0703
-                except Exception as info:
-                    extra_info = 'Error accessing Librarian: %s' % info
-                    self.log(extra_info)
-                else:
-                    of = open(cachefile + '.tmp', "wb")
-                    # Upped for great justice to 256k
-                    check_sum = hashlib.sha1()
-                    for chunk in iter(lambda: f.read(256*1024), b''):
-                        of.write(chunk)
-                        check_sum.update(chunk)
-                    of.close()
+                    if f.getcode() != 206:
+                        raise ValueError(
+                            "Server did not honour byte range request")
+                    with open(part_path, "ab") as of:
+                        for chunk in iter(lambda: f.read(256*1024), b''):
+                            of.write(chunk)
+                            with lock:
+                                progress["downloaded"] += len(chunk)
+                finally:
                     f.close()
-                    extra_info = 'Download'
-                    if check_sum.hexdigest() != sha1sum:
-                        os.remove(cachefile + '.tmp')
-                        extra_info = "Digests did not match, removing again!"
-                    else:
-                        os.rename(cachefile + '.tmp', cachefile)
-                    self.log(extra_info)
-        return (os.path.exists(cachefile), extra_info)
+                if os.path.getsize(part_path) != end - start + 1:
+                    raise ValueError(
+                        "Segment %s has the wrong size" % part_path)
+            except Exception as e:
+                errors.append(e)
+
+        workers = [
+            threading.Thread(target=fetch_part, args=part) for part in parts]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if errors:
+            raise errors[0]
+
+        sha1 = hashlib.sha1()
+        sha256 = hashlib.sha256()
+        try:
+            with open(tmpfile, "wb") as of:
+                for part_path, _, _ in parts:
+                    with open(part_path, "rb") as part:
+                        for chunk in iter(
+                                lambda: part.read(256*1024), b''):
+                            of.write(chunk)
+                            sha1.update(chunk)
+                            sha256.update(chunk)
+        except Exception:
+            # Leave just the segments, so that the next attempt resumes
+            # them rather than the incomplete file.
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            raise
+        self._removeSegments(tmpfile)
+        return sha1.hexdigest(), sha256.hexdigest()
+
+    def getDownloadStatus(self):
+        """Return the progress of any files currently being fetched.
+
+        Sizes are returned as strings, since they may exceed the range of
+        XML-RPC integers.
+        """
+        return {
+            sha1sum: {
+                "downloaded": str(progress["downloaded"]),
+                "size": (
+                    str(progress["size"]) if progress["size"] is not None
+                    else None),
+                }
+            for sha1sum, progress in self.downloads.items()}
+
+    def getCacheContents(self):
+        """Return a description of each file in the cache.
+
+        Sizes are returned as strings, since they may exceed the range of
+        XML-RPC integers.
+        """
+        return {
+            sha1sum: {
+                "size": str(entry.size),
+                "sha256": entry.sha256,
+                "fetched": entry.fetched,
+                "last_access": entry.last_access,
+                "url": entry.url,
+                }
+            for sha1sum, entry in self.filecache.entries().items()}
 
     def storeFile(self, path):
-        """Store the content of the provided path in the file cache."""
-        f = open(path, "rb")
-        tmppath = self.cachePath("storeFile.tmp")
-        of = open(tmppath, "wb")
-        try:
+        """Store the content of the provided path in the file cache.
+
+        If `[filecache] storemode` is "link" and the file is on the same
+        filesystem as the cache, then it is hashed in place and hardlinked
+        or reflinked into the cache, falling back to copying it.  Files
+        stored this way must not be modified in place afterwards.
+        """
+        sha1sum = self._storeFile(path)
+        self.evictCacheFiles(sha1sum)
+        return sha1sum
+
+    def _storeFile(self, path):
+        """Store a file in the file cache without evicting anything.
+
+        This may be called from several threads at once.
+        """
+        if (self._store_mode == "link" and
+                os.stat(path).st_dev == os.stat(self._cachepath).st_dev):
             sha1 = hashlib.sha1()
-            for chunk in iter(lambda: f.read(256*1024), b''):
-                sha1.update(chunk)
-                of.write(chunk)
+            sha256 = hashlib.sha256()
+            self._hashFile(path, sha1, sha256)
             sha1sum = sha1.hexdigest()
-        finally:
-            of.close()
-            f.close()
-        present, info = self.ensurePresent(sha1sum)
-        if present:
+            if os.path.exists(self.cachePath(sha1sum)):
+                self.filecache.touch(sha1sum)
+                return sha1sum
+            fd, tmppath = tempfile.mkstemp(
+                prefix="storeFile.", suffix=".tmp", dir=self._cachepath)
+            os.close(fd)
+            self._linkFile(path, tmppath)
+            return self._installCacheFile(
+                tmppath, sha1sum, sha256.hexdigest())
+        writer = self.openCacheFile()
+        try:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, writer, 256 * 1024)
+            writer.close()
+        except Exception:
+            writer.discard()
+            raise
+        return self._installCacheFile(
+            writer.path, writer.sha1sum, writer.sha256sum)
+
+    def _installCacheFile(self, tmppath, sha1sum, sha256sum):
+        """Move a new file in the cache into place under its checksum.
+
+        This may be called from several threads at once.
+        """
+        if os.path.exists(self.cachePath(sha1sum)):
             os.unlink(tmppath)
-            return sha1sum
-        os.rename(tmppath, self.cachePath(sha1sum))
+            self.filecache.touch(sha1sum)
+        else:
+            os.rename(tmppath, self.cachePath(sha1sum))
+            self.filecache.add(sha1sum, sha256=sha256sum)
         return sha1sum
 
+    def openCacheFile(self):
+        """Open a new file in the file cache for writing.
+
+        Once the returned `CacheFileWriter` has been written and closed,
+        pass it to `addWaitingCacheFiles`; alternatively, call its
+        `discard` method.
+        """
+        return CacheFileWriter(self._cachepath)
+
+    def _linkFile(self, path, target):
+        """Make `target` a hardlink, reflink or (failing those) copy of `path`.
+        """
+        if os.path.lexists(target):
+            os.unlink(target)
+        try:
+            os.link(path, target)
+            return
+        except OSError:
+            pass
+        with open(path, "rb") as src, open(target, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except (IOError, OSError):
+                shutil.copyfileobj(src, dst, 256*1024)
+
+    def evictCacheFiles(self, *keep):
+        """Evict old files from the cache if it is over its quota.
+
+        Files used by the current build, files waiting to be collected,
+        files being fetched, and `keep` are never evicted.
+        """
+        pinned = set(keep)
+        pinned.update(self.waitingfiles.values())
+        pinned.update(self._fetches)
+        if self.manager is not None:
+            pinned.update(self.manager.cache_files)
+        return self.filecache.evict(pinned)
+
     def addWaitingFile(self, path, name=None):
         """Add a file to the cache and store its details for reporting."""
         if name is None:
             name = os.path.basename(path)
         self.waitingfiles[name] = self.storeFile(path)
 
+    def addWaitingFiles(self, paths, names=None):
+        """Add several files to the cache, hashing them in parallel.
+
+        At most `[filecache] storeconcurrency` files are stored at once.
+        hashlib releases the GIL while hashing large buffers, so threads
+        are enough to make use of several cores.
+
+        :param paths: A sequence of paths.
+        :param names: If not None, a sequence of the names under which to
+            report each of `paths`; by default, each file is reported under
+            its base name.
+        """
+        paths = list(paths)
+        if not paths:
+            return
+        if names is None:
+            names = [os.path.basename(path) for path in paths]
+        pool = ThreadPool(min(self._store_concurrency, len(paths)))
+        try:
+            sha1sums = pool.map(self._storeFile, paths)
+        finally:
+            pool.close()
+            pool.join()
+        for name, sha1sum in zip(names, sha1sums):
+            self.waitingfiles[name] = sha1sum
+        self.evictCacheFiles()
+
+    def addWaitingCacheFiles(self, writers):
+        """Add files written using `openCacheFile` to the cache.
+
+        This stores their details for reporting, as with `addWaitingFile`.
+
+        :param writers: A dict mapping names to closed `CacheFileWriter`s.
+        """
+        for name, writer in writers.items():
+            self.waitingfiles[name] = self._installCacheFile(
+                writer.path, writer.sha1sum, writer.sha256sum)
+        self.evictCacheFiles()
+
     def abort(self):
         """Abort the current build."""
         # XXX: dsilvers: 2005-01-21: Current abort mechanism doesn't wait
@@ -535,24 +1491,51 @@ class Builder(object):
         if self.builderstatus != BuilderStatus.WAITING:
             raise ValueError('Builder is not WAITING when asked to clean')
         for f in set(self.waitingfiles.values()):
-            os.remove(self.cachePath(f))
+            self.filecache.remove(f)
         self.builderstatus = BuilderStatus.IDLE
+        if self.manager is not None:
+            self.manager.stopTargetHelper()
         if self._log is not None:
             self._log.close()
-            os.remove(self.cachePath("buildlog"))
+            os.remove(self._log_path)
             self._log = None
+        self._logtail = None
+        self._log_sanitizer = None
+        self._resetLogReaders()
         self.waitingfiles = {}
         self.builddependencies = ""
         self.manager = None
         self.buildstatus = BuildStatus.OK
+        self.evictCacheFiles()
 
     def log(self, data):
-        """Write the provided data to the log."""
+        """Write the provided data to the log.
+
+        The build log is buffered; see `flushLog`.  For builds in private
+        archives, URLs in the build log are sanitized as they are written
+        (see `_sanitizeURLs`).  Depending on `[buildlog] mirror`, the data
+        may also be copied to the daemon's own log.
+
+        This may be called from threads other than the reactor thread (see
+        `DebianBuildManager.deferGatherResults`); the data is then passed to
+        the reactor thread, which owns the log buffer, the sanitizer and
+        anyone waiting for the log.
+        """
+        if default_reactor.running and not isInIOThread():
+            default_reactor.callFromThread(self.log, data)
+            return
         if self._log is not None:
             data_bytes = (
                 data if isinstance(data, bytes) else data.encode("UTF-8"))
-            self._log.write(data_bytes)
-            self._log.flush()
+            if self._sanitizingLog():
+                data_bytes = self._log_sanitizer.feed(data_bytes)
+            self._writeLog(data_bytes)
+        if self._log_mirror == "none":
+            return
+        elif self._log_mirror == "sample":
+            self._log_chunks += 1
+            if (self._log_chunks - 1) % self._log_sample_rate:
+                return
         data_text = (
             data if isinstance(data, six.text_type)
             else data.decode("UTF-8", "replace"))
@@ -572,18 +1555,176 @@ class Builder(object):
             data_str = data_str[:-1]
         log.msg("Build log: " + data_str)
 
+    def _sanitizingLog(self):
+        return (
+            self._log_sanitizer is not None and self.manager is not None and
+            self.manager.needs_sanitized_logs)
+
+    def _writeLog(self, data_bytes):
+        if not data_bytes:
+            return
+        if self._direct_log_writers:
+            # Subprocesses are writing to the file too, so write through
+            # and let _pollLogFile account for it in order.
+            self._log.write(data_bytes)
+            self._log.flush()
+            self._pollLogFile()
+            return
+        self._log.write(data_bytes)
+        if self._logtail is not None:
+            self._logtail.append(data_bytes)
+        self._log_size += len(data_bytes)
+        self._notifyLogWaiters()
+
+    def _notifyLogWaiters(self):
+        waiters, self._log_waiters = self._log_waiters, []
+        for waiter in waiters:
+            waiter.callback(None)
+
+    def _resetLogReaders(self):
+        """Forget the current build log, waking anyone waiting for it."""
+        if self._log_watcher is not None:
+            self._log_watcher.stop()
+            self._log_watcher = None
+        self._direct_log_writers = 0
+        self._log_size = 0
+        if self._log_reader is not None:
+            self._log_reader[0].close()
+            self._log_reader = None
+        self._notifyLogWaiters()
+
+    def startDirectLog(self):
+        """Prepare for a subprocess to write straight to the build log.
+
+        This keeps the daemon out of the data path for very verbose
+        builds.  While any such subprocesses are running, the log file is
+        watched so that the in-memory tail and `readLog` stay current.
+
+        Direct capture is only used if `[buildlog] capture` is "direct",
+        the log is not compressed, and the log does not need to be
+        sanitized.  Each successful call must be paired with a call to
+        `stopDirectLog`.
+
+        :return: A file descriptor for the subprocess's stdout and stderr,
+            or None if its output must be passed to `log` instead.
+        """
+        if (self._log_capture != "direct" or
+                not isinstance(self._log, BufferedLogWriter) or
+                self._log_compression != "none" or
+                (self.manager is not None and
+                 self.manager.needs_sanitized_logs)):
+            return None
+        if not self._direct_log_writers:
+            self.flushLog()
+            self._log_watch_pos = self._log_size
+            self._log_watcher = LoopingCall(self._pollLogFile)
+            self._log_watcher.clock = self._reactor
+            self._log_watcher.start(self._log_watch_interval, now=False)
+        self._direct_log_writers += 1
+        return self._log.fileno()
+
+    def stopDirectLog(self):
+        """A subprocess has stopped writing straight to the build log."""
+        if not self._direct_log_writers:
+            return
+        self._direct_log_writers -= 1
+        if not self._direct_log_writers:
+            self._log_watcher.stop()
+            self._log_watcher = None
+            self._pollLogFile()
+
+    def _pollLogFile(self):
+        """Account for output written straight to the build log."""
+        try:
+            size = os.path.getsize(self._log_path)
+        except OSError:
+            return
+        if size <= self._log_watch_pos:
+            return
+        if self._logtail is not None:
+            with open(self._log_path, "rb") as f:
+                f.seek(max(self._log_watch_pos, size - self._logtail.size))
+                self._logtail.append(f.read(size - f.tell()))
+        self._log_size += size - self._log_watch_pos
+        self._log_watch_pos = size
+        self._notifyLogWaiters()
+
+    def flushLog(self, partial_lines=False):
+        """Write any buffered build log output to disk.
+
+        This must be called before reading the build log file.
+
+        :param partial_lines: If True, also write out any incomplete final
+            line that is being held back so that it can be sanitized.  Only
+            do this once the build has finished, since otherwise the rest
+            of the line would be sanitized separately.
+        """
+        if isinstance(self._log, BufferedLogWriter):
+            if partial_lines and self._sanitizingLog():
+                self._writeLog(self._log_sanitizer.finish())
+            self._log.sync()
+
+    @property
+    def logComplete(self):
+        """True if the build log will not grow any further."""
+        return self.builderstatus not in (
+            BuilderStatus.BUILDING, BuilderStatus.ABORTING)
+
+    def waitForLog(self):
+        """Return a `Deferred` that fires when the build log changes.
+
+        It also fires when the build completes or the log is reset.
+        """
+        d = defer.Deferred(canceller=self._cancelLogWaiter)
+        self._log_waiters.append(d)
+        return d
+
+    def _cancelLogWaiter(self, d):
+        if d in self._log_waiters:
+            self._log_waiters.remove(d)
+
+    def readLog(self, offset, size):
+        """Return up to `size` bytes of the build log from `offset`.
+
+        Offsets refer to the uncompressed (and, if necessary, sanitized)
+        log.
+        """
+        if self._log is None or offset >= self._log_size:
+            return b""
+        self.flushLog()
+        if self._log_compression != "gzip":
+            with open(self._log_path, "rb") as f:
+                f.seek(offset)
+                return f.read(size)
+        # gzip logs can't be seeked, so keep a reader open for the next
+        # call, which will usually continue from where this one left off.
+        if self._log_reader is None or self._log_reader[1] > offset:
+            if self._log_reader is not None:
+                self._log_reader[0].close()
+            self._log_reader = (GzipLogReader(open(self._log_path, "rb")), 0)
+        reader, position = self._log_reader
+        while position < offset:
+            skipped = reader.read(min(offset - position, 1024 * 1024))
+            if not skipped:
+                break
+            position += len(skipped)
+        data = reader.read(size) if position == offset else b""
+        self._log_reader = (reader, position + len(data))
+        return data
+
     def getLogTail(self):
         """Return the tail of the log.
 
         If the buildlog is not yet opened for writing (self._log is None),
         return an empty bytes object.
 
-        It safely tries to open the 'buildlog', if it doesn't exist, due to
-        job cleanup or buildlog sanitization race-conditions, it also returns
+        The tail is normally kept in memory as the log is written.  If it
+        isn't (e.g. because the log was opened by other means), this safely
+        tries to open the 'buildlog'; if it doesn't exist, due to job
+        cleanup or buildlog sanitization race-conditions, it also returns
         an empty bytes object.
 
-        When the 'buildlog' is present it returns up to 2 KiB bytes of the
-        end of the file.
+        Otherwise it returns up to 2 KiB bytes of the end of the log.
 
         The returned content will be 'sanitized', see `_sanitizeURLs` for
         further information.
@@ -591,6 +1732,27 @@ class Builder(object):
         if self._log is None:
             return b""
 
+        if self._logtail is not None:
+            # If necessary, this was sanitized as it was written.
+            return self._logtail.getvalue()
+
+        ret = self._readLogTail()
+        if self.manager.needs_sanitized_logs:
+            # This is a build in a private archive. We need to scrub
+            # the URLs contained in the buildlog excerpt in order to
+            # avoid leaking passwords.
+            log_lines = ret.splitlines()
+
+            # Please note: we are throwing away the first line (of the
+            # excerpt to be scrubbed) because it may be cut off thus
+            # thwarting the detection of embedded passwords.
+            ret = _sanitizeBuffer(b'\n'.join(log_lines[1:]))
+
+        return ret
+
+    def _readLogTail(self):
+        """Read up to 2 KiB bytes of the end of the 'buildlog' file."""
+        self.flushLog()
         rlog = None
         try:
             try:
@@ -610,19 +1772,6 @@ class Builder(object):
         finally:
             if rlog is not None:
                 rlog.close()
-
-        if self.manager.needs_sanitized_logs:
-            # This is a build in a private archive. We need to scrub
-            # the URLs contained in the buildlog excerpt in order to
-            # avoid leaking passwords.
-            log_lines = ret.splitlines()
-
-            # Please note: we are throwing away the first line (of the
-            # excerpt to be scrubbed) because it may be cut off thus
-            # thwarting the detection of embedded passwords.
-            clean_content_iter = _sanitizeURLs(log_lines[1:])
-            ret = b'\n'.join(clean_content_iter)
-
         return ret
 
     def startBuild(self, manager):
@@ -638,7 +1787,26 @@ class Builder(object):
         """Empty the log and start again."""
         if self._log is not None:
             self._log.close()
-        self._log = open(self.cachePath("buildlog"), "wb")
+        # Remove any log left over with a different compression setting,
+        # since readers prefer the compressed one.
+        for name in ("buildlog", "buildlog.gz"):
+            if os.path.exists(self.cachePath(name)):
+                os.remove(self.cachePath(name))
+        if self._log_compression == "gzip":
+            self._log_path = self.cachePath("buildlog.gz")
+            log_file = GzipLogFile(
+                open(self._log_path, "wb"), reactor=self._reactor)
+        else:
+            self._log_path = self.cachePath("buildlog")
+            # Append mode, since subprocesses may write to it directly.
+            log_file = open(self._log_path, "ab")
+        self._log = BufferedLogWriter(
+            log_file,
+            flush_size=self._log_flush_size,
+            flush_interval=self._log_flush_interval, reactor=self._reactor)
+        self._logtail = LogTail()
+        self._log_sanitizer = LogSanitizer(_sanitizeBuffer)
+        self._resetLogReaders()
 
     def builderFail(self):
         """Cease building because the builder has a problem."""
@@ -694,6 +1862,11 @@ class Builder(object):
         """Mark the build as complete and waiting interaction from the build
         daemon master.
         """
+        self.flushLog(partial_lines=True)
+        if isinstance(self._log, BufferedLogWriter):
+            # Make a compressed log a complete gzip file before it is
+            # collected.
+            self._log.finish()
         if self.builderstatus == BuilderStatus.BUILDING:
             self.builderstatus = BuilderStatus.WAITING
         elif self.builderstatus == BuilderStatus.ABORTING:
@@ -702,48 +1875,58 @@ class Builder(object):
         else:
             raise ValueError(
                 "Builder is not BUILDING|ABORTING when told build is complete")
+        self._notifyLogWaiters()
 
-    def sanitizeBuildlog(self, log_path):
-        """Removes passwords from buildlog URLs.
-
-        Because none of the URLs to be processed are expected to span
-        multiple lines and because build log files are potentially huge
-        they will be processed line by line.
 
-        :param log_path: The path to the buildlog file that is to be
-            sanitized.
-        :type log_path: ``str``
-        """
-        # First move the buildlog file that is to be sanitized out of
-        # the way.
-        unsanitized_path = self.cachePath(
-            os.path.basename(log_path) + '.unsanitized')
-        os.rename(log_path, unsanitized_path)
+class XMLRPCSystem(xmlrpc.XMLRPCIntrospection):
+    """The "system" XML-RPC methods: introspection and multicall."""
 
-        # Open the unsanitized buildlog file for reading.
-        unsanitized_file = open(unsanitized_path, 'rb')
+    @xmlrpc.withRequest
+    @defer.inlineCallbacks
+    def xmlrpc_multicall(self, request, calls):
+        """Make several calls in a single request.
 
-        # Open the file that will hold the resulting, sanitized buildlog
-        # content for writing.
-        sanitized_file = None
-
-        try:
-            sanitized_file = open(log_path, 'wb')
+        This lets buildd-manager send a whole dispatch sequence (e.g.
+        "status", "ensurepresent_many", "build") in one round trip.  Calls
+        are made in order, each waiting for the previous one to finish.
 
-            # Scrub the buildlog file line by line
-            clean_content_iter = _sanitizeURLs(unsanitized_file)
-            for line in clean_content_iter:
-                sanitized_file.write(line)
-        finally:
-            # We're done with scrubbing, close the file handles.
-            unsanitized_file.close()
-            if sanitized_file is not None:
-                sanitized_file.close()
+        :param calls: A list of dictionaries with "methodName" and "params"
+            keys.
+        :return: A list with one entry per call: either a single-element
+            list containing its result, or a dictionary with "faultCode"
+            and "faultString" keys if it failed.
+        """
+        results = []
+        for call in calls:
+            try:
+                if not isinstance(call, dict) or "methodName" not in call:
+                    raise xmlrpc.Fault(self.FAILURE, "Invalid call")
+                method_name = call["methodName"]
+                params = call.get("params", [])
+                if method_name == "system.multicall":
+                    raise xmlrpc.Fault(
+                        self.FAILURE, "Recursive system.multicall forbidden")
+                function = self._xmlrpc_parent.lookupProcedure(method_name)
+                if getattr(function, "withRequest", False):
+                    params = [request] + list(params)
+                result = yield defer.maybeDeferred(function, *params)
+                results.append([result])
+            except xmlrpc.Fault as e:
+                results.append(
+                    {"faultCode": e.faultCode, "faultString": e.faultString})
+            except Exception:
+                log.err(None, "Error in system.multicall")
+                results.append(
+                    {"faultCode": self.FAILURE, "faultString": "error"})
+        defer.returnValue(results)
 
 
 class XMLRPCBuilder(xmlrpc.XMLRPC):
     """XMLRPC builder management interface."""
 
+    # The maximum number of seconds that waitstatus may wait.
+    max_status_wait = 60
+
     def __init__(self, config):
         xmlrpc.XMLRPC.__init__(self, allowNone=True)
         # The V1.0 new-style protocol introduces string-style protocol
@@ -753,14 +1936,19 @@ class XMLRPCBuilder(xmlrpc.XMLRPC):
         self.protocolversion = '1.0'
         self.builder = Builder(config)
         self._managers = {}
-        cache = apt.Cache()
-        try:
-            installed = cache["launchpad-buildd"].installed
-            self._version = installed.version if installed else None
-        except KeyError:
-            self._version = None
+        self.putSubHandler("system", XMLRPCSystem(self))
+        self._version = None
+        self._version_checked = False
         log.msg("Initialized")
 
+    @property
+    def builder_version(self):
+        """The installed version of launchpad-buildd, or None."""
+        if not self._version_checked:
+            self._version = get_installed_version("launchpad-buildd")
+            self._version_checked = True
+        return self._version
+
     def registerManager(self, managerclass, managertag):
         self._managers[managertag] = managerclass
 
@@ -784,14 +1972,33 @@ class XMLRPCBuilder(xmlrpc.XMLRPC):
         func = getattr(self, "status_" + statusname, None)
         if func is None:
             raise ValueError("Unknown status '%s'" % status)
-        ret = {"builder_status": status}
-        if self._version is not None:
-            ret["builder_version"] = self._version
+        ret = {
+            "builder_status": status,
+            "status_serial": self.builder.status_serial,
+            }
+        if self.builder_version is not None:
+            ret["builder_version"] = self.builder_version
         ret.update(func())
+        if self.builder.downloads:
+            ret["downloads"] = self.builder.getDownloadStatus()
         if self.builder.manager is not None:
             ret.update(self.builder.manager.status())
         return ret
 
+    @defer.inlineCallbacks
+    def xmlrpc_waitstatus(self, serial, timeout=60):
+        """Wait for the status of the build daemon to change.
+
+        This returns as soon as the "status_serial" returned by `status`
+        differs from `serial`, or after `timeout` seconds (at most
+        `max_status_wait`), whichever comes first.
+
+        :return: The current status, as returned by `status`.
+        """
+        timeout = max(0, min(timeout, self.max_status_wait))
+        yield self.builder.waitForStatusChange(serial, timeout)
+        defer.returnValue(self.xmlrpc_status())
+
     def status_IDLE(self):
         """Handler for xmlrpc_status IDLE."""
         return {}
@@ -831,9 +2038,30 @@ class XMLRPCBuilder(xmlrpc.XMLRPC):
         return {"build_id": self.buildid}
 
     def xmlrpc_ensurepresent(self, sha1sum, url, username, password):
-        """Attempt to ensure the given file is present."""
+        """Attempt to ensure the given file is present.
+
+        This returns a `Deferred`, so the daemon continues to answer other
+        requests while the file is being fetched.
+        """
         return self.builder.ensurePresent(sha1sum, url, username, password)
 
+    def xmlrpc_ensurepresent_many(self, files):
+        """Attempt to ensure that several files are present.
+
+        :param files: A list of [sha1sum, url, username, password] lists.
+        :return: A list of [present, info] lists, in the same order.
+        """
+        return self.builder.ensurePresentMany(
+            [tuple(f) for f in files])
+
+    def xmlrpc_listcache(self):
+        """Return a description of each file in the file cache.
+
+        :return: A dictionary mapping SHA-1 checksums to dictionaries with
+            "size", "sha256", "fetched", "last_access" and "url" keys.
+        """
+        return self.builder.getCacheContents()
+
     def xmlrpc_abort(self):
         """Abort the current build."""
         self.builder.abort()
@@ -844,6 +2072,7 @@ class XMLRPCBuilder(xmlrpc.XMLRPC):
         self.builder.clean()
         return BuilderStatus.IDLE
 
+    @defer.inlineCallbacks
     def xmlrpc_build(self, buildid, managertag, chrootsum, filemap, args):
         """Check if requested arguments are sane and initiate build procedure
 
@@ -853,26 +2082,26 @@ class XMLRPCBuilder(xmlrpc.XMLRPC):
         # check requested manager
         if managertag not in self._managers:
             extra_info = "%s not in %r" % (managertag, list(self._managers))
-            return (BuilderStatus.UNKNOWNBUILDER, extra_info)
+            defer.returnValue((BuilderStatus.UNKNOWNBUILDER, extra_info))
         # check requested chroot availability
-        chroot_present, info = self.builder.ensurePresent(chrootsum)
+        chroot_present, info = yield self.builder.ensurePresent(chrootsum)
         if not chroot_present:
             extra_info = """CHROOTSUM -> %s
             ***** INFO *****
             %s
             ****************
             """ % (chrootsum, info)
-            return (BuilderStatus.UNKNOWNSUM, extra_info)
+            defer.returnValue((BuilderStatus.UNKNOWNSUM, extra_info))
         # check requested files availability
         for filesum in filemap.values():
-            file_present, info = self.builder.ensurePresent(filesum)
+            file_present, info = yield self.builder.ensurePresent(filesum)
             if not file_present:
                 extra_info = """FILESUM -> %s
                 ***** INFO *****
                 %s
                 ****************
                 """ % (filesum, info)
-                return (BuilderStatus.UNKNOWNSUM, extra_info)
+                defer.returnValue((BuilderStatus.UNKNOWNSUM, extra_info))
         # check buildid sanity
         if buildid is None or buildid == "" or buildid == 0:
             raise ValueError(buildid)
@@ -883,4 +2112,47 @@ class XMLRPCBuilder(xmlrpc.XMLRPC):
         self.builder.startBuild(
             self._managers[managertag](self.builder, buildid))
         self.builder.manager.initiate(filemap, chrootsum, args)
-        return (BuilderStatus.BUILDING, buildid)
+        defer.returnValue((BuilderStatus.BUILDING, buildid))
+
+
+def _jsonDefault(obj):
+    if isinstance(obj, Binary):
+        return obj.data.decode("UTF-8", "replace")
+    raise TypeError("%r is not JSON serializable" % (obj,))
+
+
+class StatusResource(resource.Resource):
+    """Serve the builder's status as JSON.
+
+    The response contains the same information as the "status" XML-RPC
+    call, with the log tail decoded as text.  Its ETag starts with the
+    builder's status serial, so pollers can send "If-None-Match" and get
+    an empty "304 Not Modified" response if nothing has changed.
+    """
+
+    isLeaf = True
+
+    def __init__(self, rpc):
+        """Create a StatusResource.
+
+        :param rpc: An `XMLRPCBuilder`.
+        """
+        resource.Resource.__init__(self)
+        self.rpc = rpc
+
+    def render_GET(self, request):
+        body = json.dumps(
+            self.rpc.xmlrpc_status(), sort_keys=True,
+            default=_jsonDefault).encode("UTF-8")
+        etag = ('"%d-%s"' % (
+            self.rpc.builder.status_serial,
+            hashlib.sha1(body).hexdigest()[:16])).encode("UTF-8")
+        request.setHeader(b"ETag", etag)
+        request.setHeader(b"Cache-Control", b"no-cache")
+        if_none_match = request.getHeader(b"If-None-Match")
+        if if_none_match is not None and etag in [
+                tag.strip() for tag in if_none_match.split(b",")]:
+            request.setResponseCode(http.NOT_MODIFIED)
+            return b""
+        request.setHeader(b"Content-Type", b"application/json")
+        return body
@@ -0,0 +1,464 @@
+# Copyright 2026 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Writing build logs."""
+
+from __future__ import print_function
+
+__metaclass__ = type
+
+import os
+import zlib
+
+from twisted.internet import defer
+from twisted.internet import reactor as default_reactor
+from twisted.internet.interfaces import IPullProducer
+from twisted.web import (
+    resource,
+    server,
+    static,
+    )
+from zope.interface import implementer
+
+
+# gzip framing for zlib.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class BufferedLogWriter:
+    """A build log file that buffers writes.
+
+    Builds can produce output in very many small chunks.  Rather than
+    writing and flushing each of them, we collect them in memory and write
+    them out once `flush_size` bytes have accumulated or `flush_interval`
+    seconds have passed since the first unflushed write, whichever comes
+    first.
+    """
+
+    def __init__(self, f, flush_size=64 * 1024, flush_interval=1.0,
+                 reactor=None):
+        """Create a BufferedLogWriter.
+
+        :param f: A file object opened for writing in binary mode.
+        :param flush_size: Flush once at least this many bytes are
+            buffered.
+        :param flush_interval: Flush at most this many seconds after a
+            write.
+        """
+        self._file = f
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        if reactor is None:
+            reactor = default_reactor
+        self._reactor = reactor
+        self._buffer = []
+        self._buffered = 0
+        self._delayed_flush = None
+
+    @property
+    def name(self):
+        return self._file.name
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def write(self, data):
+        """Buffer some bytes to be written to the log."""
+        if not data:
+            return
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.flush_size:
+            self.flush()
+        elif self._delayed_flush is None:
+            self._delayed_flush = self._reactor.callLater(
+                self.flush_interval, self.flush)
+
+    def flush(self):
+        """Write out any buffered bytes."""
+        if self._delayed_flush is not None:
+            if self._delayed_flush.active():
+                self._delayed_flush.cancel()
+            self._delayed_flush = None
+        if self._buffer:
+            self._file.write(b"".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+        self._file.flush()
+
+    def sync(self):
+        """Flush, making everything written so far readable from the file.
+
+        For compressed logs, this is more expensive than `flush`.
+        """
+        self.flush()
+        if isinstance(self._file, GzipLogFile):
+            self._file.sync()
+
+    def finish(self):
+        """Flush, and finish any compressed stream in the file.
+
+        The log may still be written to afterwards.
+        """
+        self.flush()
+        if isinstance(self._file, GzipLogFile):
+            self._file.finish()
+
+    def close(self):
+        """Flush and close the log."""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class LogTail:
+    """The most recent bytes written to a build log, kept in memory."""
+
+    def __init__(self, size=2048):
+        self.size = size
+        self._data = b""
+
+    def append(self, data):
+        """Add some bytes, discarding the oldest ones if necessary."""
+        if len(data) >= self.size:
+            self._data = data[-self.size:]
+        else:
+            self._data = (self._data + data)[-self.size:]
+
+    def getvalue(self):
+        """Return the current contents of the tail."""
+        return self._data
+
+
+class LogSanitizer:
+    """Sanitize build log output as it is written.
+
+    Output arrives in chunks that may split lines, so an incomplete final
+    line is carried over until the rest of it arrives.  To bound memory
+    use, once a carried-over line grows beyond `max_carry` bytes its start
+    is sanitized and emitted, but its last word (or, failing that, its last
+    `overlap` bytes) is still carried over and sanitized together with the
+    next chunk, so that a credential split across chunks is not emitted
+    half at a time.
+    """
+
+    def __init__(self, sanitize, max_carry=64 * 1024, overlap=4096):
+        """Create a LogSanitizer.
+
+        :param sanitize: A callable that takes a byte string consisting of
+            whole lines and returns it sanitized.
+        :param max_carry: The maximum number of bytes to carry over.
+        :param overlap: The number of bytes of an overlong line that are
+            always carried over.  Any URL shorter than this is never split.
+        """
+        self._sanitize = sanitize
+        self.max_carry = max_carry
+        self.overlap = min(overlap, max_carry)
+        self._carry = b""
+
+    def _split(self, data):
+        # Find where to split an overlong partial line.  Prefer to split at
+        # whitespace, so that a word is never cut; otherwise carry over at
+        # least `overlap` bytes, and back off to the start of any URL or
+        # proxy authentication parameter that begins in the bytes before
+        # that.
+        split = len(data) - self.overlap
+        lower = len(data) - self.max_carry
+        space = max(
+            data.rfind(b" ", lower, split), data.rfind(b"\t", lower, split))
+        if space >= 0:
+            return space + 1
+        for marker in (b"://", b",proxyauth="):
+            start = data.rfind(marker, max(0, split - self.overlap), split)
+            if start >= 0:
+                split = start
+        return split
+
+    def feed(self, data):
+        """Sanitize a chunk of output.
+
+        :return: The sanitized bytes for all complete lines so far.
+        """
+        data = self._carry + data
+        end = data.rfind(b"\n") + 1
+        if not end:
+            if len(data) <= self.max_carry:
+                self._carry = data
+                return b""
+            end = self._split(data)
+        self._carry = data[end:]
+        return self._sanitize(data[:end])
+
+    def finish(self):
+        """Sanitize and return any carried-over incomplete line.
+
+        Only call this once no more output will arrive.
+        """
+        data, self._carry = self._carry, b""
+        if not data:
+            return b""
+        return self._sanitize(data)
+
+
+class GzipLogFile:
+    """A build log file that is compressed in gzip format as it is written.
+
+    `sync` ends with a zlib sync flush, so that everything written so far
+    can be decompressed even though the gzip stream is not yet finished.
+    Sync flushes cost compression, so they are only done when the build
+    log is about to be read, and otherwise by `flush` at most every
+    `sync_interval` seconds so that anyone reading the file directly
+    doesn't fall too far behind.
+
+    `finish` completes the gzip stream, so that the file is a valid gzip
+    file once the build has finished.  If anything is written after that,
+    it is appended to the file as a new gzip member.
+    """
+
+    def __init__(self, f, compresslevel=6, sync_interval=60.0,
+                 reactor=None):
+        self._file = f
+        self.compresslevel = compresslevel
+        self._compressor = self._makeCompressor()
+        self.sync_interval = sync_interval
+        if reactor is None:
+            reactor = default_reactor
+        self._reactor = reactor
+        self._last_sync = reactor.seconds()
+        self._unsynced = False
+        self._closed = False
+
+    def _makeCompressor(self):
+        return zlib.compressobj(
+            self.compresslevel, zlib.DEFLATED, GZIP_WBITS)
+
+    @property
+    def name(self):
+        return self._file.name
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def write(self, data):
+        if self._compressor is None:
+            # The stream was finished; start a new member.
+            self._file = open(self._file.name, "ab")
+            self._compressor = self._makeCompressor()
+        self._file.write(self._compressor.compress(data))
+        self._unsynced = True
+
+    def flush(self):
+        """Write out whatever the compressor has produced so far."""
+        if self._compressor is None:
+            return
+        if self._reactor.seconds() - self._last_sync >= self.sync_interval:
+            self.sync()
+        else:
+            self._file.flush()
+
+    def sync(self):
+        """Make everything written so far readable from the file."""
+        if self._compressor is None:
+            return
+        if self._unsynced:
+            self._file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+            self._unsynced = False
+        self._file.flush()
+        self._last_sync = self._reactor.seconds()
+
+    def finish(self):
+        """Finish the gzip stream, and close the underlying file."""
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush())
+            self._file.close()
+            self._compressor = None
+            self._unsynced = False
+
+    def close(self):
+        self.finish()
+        self._closed = True
+
+
+class GzipLogReader:
+    """Read a gzip build log, which may still be being written."""
+
+    def __init__(self, f):
+        self._file = f
+        self._decompressor = zlib.decompressobj(GZIP_WBITS)
+        self._pending = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            chunk = self._file.read(64 * 1024)
+            if not chunk:
+                break
+            self._pending += self._decompressor.decompress(chunk)
+            # Anything after the end of a gzip member (see
+            # `GzipLogFile.finish`) is the start of another one.
+            while self._decompressor.unused_data:
+                rest = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(GZIP_WBITS)
+                self._pending += self._decompressor.decompress(rest)
+        if size < 0:
+            data, self._pending = self._pending, b""
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_build_log(cachepath):
+    """Open the build log in `cachepath` for reading, decompressing it."""
+    gzip_path = os.path.join(cachepath, "buildlog.gz")
+    if os.path.exists(gzip_path):
+        return GzipLogReader(open(gzip_path, "rb"))
+    return open(os.path.join(cachepath, "buildlog"), "rb")
+
+
+def read_build_log_tail(cachepath, size):
+    """Return up to the last `size` bytes of the build log in `cachepath`."""
+    with open_build_log(cachepath) as log:
+        if isinstance(log, GzipLogReader):
+            tail = b""
+            for chunk in iter(lambda: log.read(64 * 1024), b""):
+                tail = (tail + chunk)[-size:]
+            return tail
+        try:
+            log.seek(-size, os.SEEK_END)
+        except IOError:
+            pass
+        return log.read(size)
+
+
+@implementer(IPullProducer)
+class _DecompressingProducer:
+
+    def __init__(self, request, log):
+        self.request = request
+        self.log = log
+
+    def start(self):
+        self.request.registerProducer(self, False)
+
+    def resumeProducing(self):
+        if self.request is None:
+            return
+        chunk = self.log.read(64 * 1024)
+        if chunk:
+            self.request.write(chunk)
+        else:
+            self.log.close()
+            self.request.unregisterProducer()
+            self.request.finish()
+            self.request = None
+
+    def stopProducing(self):
+        self.log.close()
+        self.request = None
+
+
+class CompressedLogResource(resource.Resource):
+    """Serve a gzip build log.
+
+    Clients that accept gzip encoding get the compressed file with
+    "Content-Encoding: gzip"; others get it decompressed on the fly.
+    """
+
+    isLeaf = True
+
+    def __init__(self, path):
+        resource.Resource.__init__(self)
+        self.path = path
+
+    def render_GET(self, request):
+        request.setHeader(b"Vary", b"Accept-Encoding")
+        accept_encoding = request.getHeader(b"Accept-Encoding") or b""
+        encodings = [
+            token.split(b";")[0].strip().lower()
+            for token in accept_encoding.split(b",")]
+        if b"gzip" in encodings:
+            return static.File(self.path, defaultType="text/plain").render(
+                request)
+        request.setHeader(b"Content-Type", b"text/plain")
+        _DecompressingProducer(
+            request, GzipLogReader(open(self.path, "rb"))).start()
+        return server.NOT_DONE_YET
+
+
+class BuildLogResource(resource.Resource):
+    """Serve the build log incrementally.
+
+    "GET ?offset=N&wait=SECONDS" returns up to `max_read` bytes of the
+    build log starting at byte N of the uncompressed (and, if necessary,
+    sanitized) log.  If there are none yet and the build is still running,
+    the request waits up to `wait` seconds (at most `max_wait`) for more.
+    The "X-Log-Offset" response header gives the offset to request next,
+    and "X-Log-Complete" is "true" once the log will not grow any further.
+    """
+
+    isLeaf = True
+    max_read = 1024 * 1024
+    max_wait = 60
+
+    def __init__(self, builder, reactor=None):
+        resource.Resource.__init__(self)
+        self.builder = builder
+        if reactor is None:
+            reactor = default_reactor
+        self._reactor = reactor
+
+    def render_GET(self, request):
+        try:
+            offset = int(request.args.get(b"offset", [b"0"])[0])
+            wait = float(request.args.get(b"wait", [b"0"])[0])
+        except ValueError:
+            offset = wait = -1
+        if offset < 0 or wait < 0:
+            request.setResponseCode(400)
+            return b"Invalid offset or wait\n"
+        self._serve(request, offset, min(wait, self.max_wait))
+        return server.NOT_DONE_YET
+
+    def _serve(self, request, offset, wait):
+        data = self.builder.readLog(offset, self.max_read)
+        complete = self.builder.logComplete
+        if data or complete or not wait:
+            request.setHeader(b"Content-Type", b"application/octet-stream")
+            request.setHeader(
+                b"X-Log-Offset", str(offset + len(data)).encode("UTF-8"))
+            request.setHeader(
+                b"X-Log-Complete", b"true" if complete else b"false")
+            request.write(data)
+            request.finish()
+            return
+
+        state = {"gone": False}
+        d = self.builder.waitForLog()
+        timeout = self._reactor.callLater(wait, d.cancel)
+
+        def disconnected(failure):
+            state["gone"] = True
+            d.cancel()
+
+        def woken(result):
+            if timeout.active():
+                timeout.cancel()
+            if not state["gone"]:
+                self._serve(request, offset, 0)
+
+        request.notifyFinish().addErrback(disconnected)
+        d.addErrback(lambda failure: failure.trap(defer.CancelledError))
+        d.addCallback(woken)
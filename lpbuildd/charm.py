@@ -95,9 +95,8 @@ class CharmBuildManager(BuildManagerProxyMixin, DebianBuildManager):
         """Gather the results of the build and add them to the file cache."""
         output_path = os.path.join("/home/buildd", self.name)
         if self.backend.path_exists(output_path):
-            for entry in sorted(self.backend.listdir(output_path)):
-                path = os.path.join(output_path, entry)
-                if self.backend.islink(path):
-                    continue
-                if entry.endswith(".charm") or entry.endswith(".manifest"):
-                    self.addWaitingFileFromBackend(path)
+            self.addWaitingFilesFromBackend(
+                output_path,
+                filter=lambda entry, _: entry.endswith(
+                    (".charm", ".manifest")),
+                max_depth=1)
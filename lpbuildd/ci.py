@@ -62,6 +62,9 @@ class CIBuildManager(BuildManagerProxyMixin, DebianBuildManager):
         self.revocation_endpoint = extra_args.get("revocation_endpoint")
         self.proxy_service = None
         self.job_status = {}
+        # The extra status last returned by `status`, and the status it was
+        # built from.  Reset whenever `job_status` changes.
+        self._status_snapshot = None
 
         super(CIBuildManager, self).initiate(files, chroot, extra_args)
 
@@ -169,6 +172,7 @@ class CIBuildManager(BuildManagerProxyMixin, DebianBuildManager):
                 self.alreadyfailed = True
         yield self.deferGatherResults(reap=False)
         self.job_status[self.current_job_id]["result"] = result
+        self._status_snapshot = None
 
         self.job_index += 1
         if self.job_index >= len(self.jobs[self.stage_index]):
@@ -205,9 +209,15 @@ class CIBuildManager(BuildManagerProxyMixin, DebianBuildManager):
 
     def status(self):
         """See `BuildManager.status`."""
-        status = super(CIBuildManager, self).status()
-        status["jobs"] = dict(self.job_status)
-        return status
+        extra_status = super(CIBuildManager, self).status()
+        if (self._status_snapshot is None or
+                self._status_snapshot[0] is not extra_status):
+            status = dict(extra_status)
+            status["jobs"] = {
+                job_id: dict(job_status)
+                for job_id, job_status in self.job_status.items()}
+            self._status_snapshot = (extra_status, status)
+        return self._status_snapshot[1]
 
     def gatherResults(self):
         """Gather the results of the CI job that just completed.
@@ -217,23 +227,27 @@ class CIBuildManager(BuildManagerProxyMixin, DebianBuildManager):
         job_status = {}
         output_path = os.path.join("/build", "output", self.current_job_id)
         log_path = "%s.log" % output_path
-        if self.backend.path_exists(log_path):
+        stats = self.backend.stat_many([log_path, output_path])
+        # As with `path_exists`, a dangling symbolic link doesn't count.
+        existing = {
+            path for path, path_stat in stats.items()
+            if path_stat is not None and
+            path_stat.target_type not in ("N", "L")}
+        if log_path in existing:
             log_name = "%s.log" % self.current_job_id
             self.addWaitingFileFromBackend(log_path, log_name)
             job_status["log"] = self._builder.waitingfiles[log_name]
-        if self.backend.path_exists(output_path):
-            for entry in sorted(self.backend.find(
-                    output_path, include_directories=False)):
-                path = os.path.join(output_path, entry)
-                if self.backend.islink(path):
-                    continue
-                entry_base = os.path.basename(entry)
-                name = os.path.join(self.current_job_id, entry_base)
-                self.addWaitingFileFromBackend(path, name=name)
-                job_status.setdefault("output", {})[entry_base] = (
-                    self._builder.waitingfiles[name])
+        if output_path in existing:
+            names = self.addWaitingFilesFromBackend(
+                output_path,
+                name=lambda entry: os.path.join(
+                    self.current_job_id, os.path.basename(entry)))
+            for name in names:
+                job_status.setdefault("output", {})[
+                    os.path.basename(name)] = self._builder.waitingfiles[name]
 
         # Save a file map for this job in the extra status file.  This
         # allows buildd-manager to fetch job logs/output incrementally
         # rather than having to wait for the entire CI job to finish.
         self.job_status[self.current_job_id] = job_status
+        self._status_snapshot = None
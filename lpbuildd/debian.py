@@ -8,7 +8,6 @@ __metaclass__ = type
 
 import base64
 import io
-import os
 import re
 import signal
 
@@ -26,6 +25,7 @@ from lpbuildd.builder import (
     BuildManager,
     get_build_path,
     )
+from lpbuildd.buildlog import open_build_log
 
 
 class DebianBuildState:
@@ -51,6 +51,15 @@ class DebianBuildManager(BuildManager):
         self.alreadyfailed = False
         self._iterator = None
 
+    @property
+    def _state(self):
+        return self._current_state
+
+    @_state.setter
+    def _state(self, value):
+        self._current_state = value
+        self._builder.notifyStatusChange()
+
     @property
     def initial_build_state(self):
         raise NotImplementedError()
@@ -121,12 +130,12 @@ class DebianBuildManager(BuildManager):
         The primary file we care about is the .changes file. We key from there.
         """
         path = self.getChangesFilename()
-        self._builder.addWaitingFile(path)
+        paths = [path]
 
         with io.open(path, "r", errors="replace") as chfile:
             for fn in self._parseChangesFile(chfile):
-                self._builder.addWaitingFile(
-                    get_build_path(self.home, self._buildid, fn))
+                paths.append(get_build_path(self.home, self._buildid, fn))
+        self._builder.addWaitingFiles(paths)
 
     def deferGatherResults(self, reap=True):
         """Gather the results of the build in a thread."""
@@ -246,8 +255,8 @@ class DebianBuildManager(BuildManager):
         stop_regexes = [
             re.compile(pattern.encode("UTF-8"), flags)
             for pattern, flags in stop_patterns_and_flags]
-        buildlog_path = os.path.join(self._cachepath, "buildlog")
-        with open(buildlog_path, "rb") as buildlog:
+        self._builder.flushLog()
+        with open_build_log(self._cachepath) as buildlog:
             window = b""
             chunk = buildlog.read(chunk_size)
             while chunk:
@@ -334,6 +343,7 @@ class DebianBuildManager(BuildManager):
             # Successful clean
             if not self.alreadyfailed:
                 self._builder.buildOK()
+        self.stopTargetHelper()
         self._builder.buildComplete()
 
     def abortReap(self):
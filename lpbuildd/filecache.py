@@ -0,0 +1,363 @@
+# Copyright 2026 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tracking and eviction for the builder's file cache."""
+
+from __future__ import print_function
+
+__metaclass__ = type
+
+import binascii
+from collections import namedtuple
+from contextlib import contextmanager
+import errno
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from twisted.python import log
+from twisted.web import (
+    resource,
+    static,
+    )
+
+from lpbuildd.buildlog import CompressedLogResource
+
+
+# Files in the cache are named after their SHA-1 checksums.  Anything else
+# (the build log, partial downloads, the index, etc.) is not tracked.
+cache_entry_re = re.compile(r"^[0-9a-f]{40}$")
+
+size_suffixes = {
+    "K": 1024,
+    "M": 1024 ** 2,
+    "G": 1024 ** 3,
+    "T": 1024 ** 4,
+    }
+
+
+def parse_size(text):
+    """Parse a size in bytes, optionally with a K/M/G/T suffix."""
+    text = text.strip()
+    multiplier = 1
+    if text and text[-1].upper() in size_suffixes:
+        multiplier = size_suffixes[text[-1].upper()]
+        text = text[:-1]
+    return int(text) * multiplier
+
+
+CacheEntry = namedtuple(
+    "CacheEntry", ["size", "sha256", "fetched", "last_access", "url"])
+
+
+class CacheFileWriter:
+    """A new file being written to the file cache.
+
+    Data is hashed as it is written, so that the file can be moved into
+    place under its SHA-1 checksum without reading it again.
+    """
+
+    def __init__(self, path):
+        """Create a CacheFileWriter.
+
+        :param path: The path to the cache directory.  The file is written
+            to a temporary name in this directory.
+        """
+        # Unlike tempfile.mkstemp, create the file with the usual
+        # permissions for the process's umask, as for downloaded files.
+        while True:
+            name = binascii.hexlify(os.urandom(8)).decode("ASCII")
+            self.path = os.path.join(path, "storeFile.%s.tmp" % name)
+            try:
+                fd = os.open(
+                    self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            else:
+                break
+        self._file = os.fdopen(fd, "wb")
+        self._sha1 = hashlib.sha1()
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    @property
+    def sha1sum(self):
+        return self._sha1.hexdigest()
+
+    @property
+    def sha256sum(self):
+        return self._sha256.hexdigest()
+
+    def write(self, data):
+        self._sha1.update(data)
+        self._sha256.update(data)
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        """Close and remove the file without adding it to the cache."""
+        self.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class FileCache:
+    """The contents of the builder's file cache.
+
+    This keeps track of the size and last access time of each file in the
+    cache, and evicts the least recently used files when the total size
+    exceeds a quota.  Access times are also recorded in the files'
+    modification times, so that they survive restarts.
+
+    If an index path is given, then entries are also recorded in a small
+    SQLite database along with their SHA-256 checksums, fetch times and
+    origin URLs.  At startup the index is checked against the files on
+    disk using only their sizes, so this is fast even for large caches.
+    Access times are written to the index in batches when evicting files,
+    rather than every time a file is used; since they are also kept in
+    modification times, none are lost if the builder stops in between.
+
+    Methods may be called from threads other than the reactor thread.
+    """
+
+    def __init__(self, path, quota=None, index_path=None):
+        """Create a FileCache.
+
+        :param path: The path to the cache directory.
+        :param quota: The maximum total size of files in the cache in
+            bytes, or None for no limit.
+        :param index_path: The path to the persistent index, or None.
+        """
+        self.path = path
+        self.quota = quota
+        self._lock = threading.Lock()
+        # Maps names to `CacheEntry` tuples.
+        self._entries = {}
+        # Names of entries whose access times have yet to be written to
+        # the index.
+        self._unsaved_access = set()
+        self._index = None
+        if index_path is not None:
+            self._index = sqlite3.connect(
+                index_path, check_same_thread=False, isolation_level=None)
+            self._index.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "sha1 TEXT PRIMARY KEY, size INTEGER, sha256 TEXT, "
+                "fetched REAL, last_access REAL, url TEXT)")
+        self.scan()
+
+    @contextmanager
+    def _transaction(self):
+        # Must be called with self._lock held.  Commits any index changes
+        # made in the body together, rather than one at a time.
+        if self._index is None:
+            yield
+            return
+        self._index.execute("BEGIN")
+        try:
+            yield
+        except Exception:
+            self._index.execute("ROLLBACK")
+            raise
+        self._index.execute("COMMIT")
+
+    def _store(self, name, entry):
+        # Must be called with self._lock held.
+        self._entries[name] = entry
+        self._unsaved_access.discard(name)
+        if self._index is not None:
+            self._index.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (name,) + tuple(entry))
+
+    def _forget(self, name):
+        # Must be called with self._lock held.
+        entry = self._entries.pop(name, None)
+        self._unsaved_access.discard(name)
+        if self._index is not None:
+            self._index.execute("DELETE FROM files WHERE sha1 = ?", (name,))
+        return entry
+
+    def _saveAccessTimes(self):
+        # Must be called with self._lock held.
+        if self._unsaved_access and self._index is not None:
+            self._index.executemany(
+                "UPDATE files SET last_access = ? WHERE sha1 = ?",
+                [(self._entries[name].last_access, name)
+                 for name in self._unsaved_access])
+        self._unsaved_access = set()
+
+    def scan(self):
+        """Rebuild our view of the cache from the filesystem.
+
+        Index entries whose files are missing or have changed size are
+        discarded, and files that are not in the index are added to it.
+        """
+        with self._lock, self._transaction():
+            self._unsaved_access = set()
+            indexed = {}
+            if self._index is not None:
+                for row in self._index.execute("SELECT * FROM files"):
+                    indexed[row[0]] = CacheEntry(*row[1:])
+            self._entries = {}
+            for name in os.listdir(self.path):
+                if not cache_entry_re.match(name):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                entry = indexed.pop(name, None)
+                if entry is not None and entry.size == st.st_size:
+                    self._entries[name] = entry._replace(
+                        last_access=max(entry.last_access, st.st_mtime))
+                else:
+                    self._store(name, CacheEntry(
+                        st.st_size, None, st.st_mtime, st.st_mtime, None))
+            for name in indexed:
+                self._forget(name)
+
+    @property
+    def total_size(self):
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._entries
+
+    def entries(self):
+        """Return a dictionary mapping names to `CacheEntry` tuples."""
+        with self._lock:
+            return dict(self._entries)
+
+    def add(self, name, sha256=None, url=None):
+        """Record that a file has been added to the cache.
+
+        :param sha256: The file's SHA-256 checksum, if known.
+        :param url: The URL the file was fetched from, if any.
+        """
+        if not cache_entry_re.match(name):
+            return
+        try:
+            size = os.path.getsize(os.path.join(self.path, name))
+        except OSError:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._entries.get(name)
+            if old is not None and old.size == size:
+                sha256 = sha256 or old.sha256
+                url = url or old.url
+            self._store(name, CacheEntry(size, sha256, now, now, url))
+
+    def touch(self, name):
+        """Record that a file in the cache has been used.
+
+        :return: True if the file is present, otherwise False.
+        """
+        now = time.time()
+        try:
+            os.utime(os.path.join(self.path, name), (now, now))
+        except OSError:
+            with self._lock:
+                self._forget(name)
+            return False
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries[name] = entry._replace(last_access=now)
+                if self._index is not None:
+                    self._unsaved_access.add(name)
+        return True
+
+    def isPresent(self, name):
+        """Check whether a file is present in the cache, marking it as used.
+
+        Files we know about are checked by updating their access times.
+        Files we don't know about (perhaps placed in the cache by hand)
+        are adopted if they exist.
+        """
+        if name in self:
+            return self.touch(name)
+        if os.path.exists(os.path.join(self.path, name)):
+            self.add(name)
+            return True
+        return False
+
+    def _removeFile(self, name):
+        try:
+            os.remove(os.path.join(self.path, name))
+        except OSError:
+            pass
+
+    def remove(self, name):
+        """Remove a file from the cache."""
+        with self._lock:
+            self._forget(name)
+        self._removeFile(name)
+
+    def evict(self, pinned=()):
+        """Evict least recently used files until we are within the quota.
+
+        This also writes any recent access times to the index.
+
+        :param pinned: Names of files that must not be evicted.
+        :return: A list of the names of files that were evicted.
+        """
+        with self._lock, self._transaction():
+            self._saveAccessTimes()
+            if self.quota is None:
+                return []
+            total = sum(entry.size for entry in self._entries.values())
+            if total <= self.quota:
+                return []
+            candidates = sorted(
+                (entry.last_access, name)
+                for name, entry in self._entries.items()
+                if name not in pinned)
+            evicted = []
+            for _, name in candidates:
+                if total <= self.quota:
+                    break
+                total -= self._forget(name).size
+                evicted.append(name)
+        for name in evicted:
+            log.msg("Evicting %s from file cache" % name)
+            self._removeFile(name)
+        return evicted
+
+
+class FileCacheResource(static.File):
+    """Serve the file cache over HTTP.
+
+    Internal files such as the index, whose names start with ".", are
+    hidden.  If the build log is compressed, then it is also available
+    as "buildlog".
+    """
+
+    def getChild(self, path, request):
+        if path.startswith(b"."):
+            return resource.NoResource()
+        if path == b"buildlog":
+            gzip_path = os.path.join(self.path, "buildlog.gz")
+            if (not os.path.exists(os.path.join(self.path, "buildlog")) and
+                    os.path.exists(gzip_path)):
+                return CompressedLogResource(gzip_path)
+        return static.File.getChild(self, path, request)
+
+    def listNames(self):
+        return [
+            name for name in static.File.listNames(self)
+            if not name.startswith(".")]
@@ -3,8 +3,6 @@
 
 __metaclass__ = type
 
-import os
-
 from six.moves.configparser import (
     NoOptionError,
     NoSectionError,
@@ -114,8 +112,6 @@ class LiveFilesystemBuildManager(DebianBuildManager):
 
     def gatherResults(self):
         """Gather the results of the build and add them to the file cache."""
-        for entry in sorted(self.backend.listdir("/build")):
-            path = os.path.join("/build", entry)
-            if (entry.startswith("livecd.") and
-                    not self.backend.islink(path)):
-                self.addWaitingFileFromBackend(path)
+        self.addWaitingFilesFromBackend(
+            "/build", filter=lambda entry, _: entry.startswith("livecd."),
+            max_depth=1)
@@ -127,12 +127,13 @@ class OCIBuildManager(BuildManagerProxyMixin, DebianBuildManager):
             config = json.load(config_fp)
         diff_ids = config["rootfs"]["diff_ids"]
         digest_diff_map = {}
+        layer_paths = []
         for diff_id, layer_id in zip(diff_ids, section['Layers']):
             layer_id = layer_id.split('/')[0]
             diff_file = os.path.join(sha_directory, diff_id.split(':')[1])
             layer_path = os.path.join(
                 extract_path, "{}.tar.gz".format(layer_id))
-            self._builder.addWaitingFile(layer_path)
+            layer_paths.append(layer_path)
             # If we have a mapping between diff and existing digest,
             # this means this layer has been pulled from a remote.
             # We should maintain the same digest to achieve layer reuse
@@ -153,6 +154,7 @@ class OCIBuildManager(BuildManagerProxyMixin, DebianBuildManager):
                 "source": source,
                 "layer_id": layer_id
             }
+        self._builder.addWaitingFiles(layer_paths)
 
         return digest_diff_map
 
@@ -253,13 +255,10 @@ class OCIBuildManager(BuildManagerProxyMixin, DebianBuildManager):
         # (FROM scratch), then this directory will not exist and
         # we will have no contents from it.
         if self.backend.path_exists(sha_path):
-            sha_files = [x for x in self.backend.listdir(sha_path)
-                         if not x.startswith('.')]
-            for file in sha_files:
-                self.backend.copy_out(
-                    os.path.join(sha_path, file),
-                    os.path.join(sha_directory, file)
-                )
+            self.backend.copy_out_tree(
+                sha_path, sha_directory,
+                filter=lambda entry, _: not entry.startswith('.'),
+                max_depth=1, follow_links=True)
         else:
             self._builder.log("No metadata directory at {}".format(sha_path))
 
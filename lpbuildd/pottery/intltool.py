@@ -55,20 +55,31 @@ def check_potfiles_in(backend, path):
     # Abort nicely if the directory does not exist.
     if not backend.isdir(path):
         return False
-    # Remove stale files from a previous run of intltool-update -m.
+    _remove_intltool_update_files(backend, [path])
+    if not _run_intltool_update_m(backend, path):
+        return False
+    return not backend.path_exists(os.path.join(path, "notexist"))
+
+
+def _remove_intltool_update_files(backend, paths):
+    """Remove stale files from a previous run of intltool-update -m."""
     backend.run(
         ["rm", "-f"] +
-        [os.path.join(path, name) for name in ("missing", "notexist")])
+        [os.path.join(path, name)
+         for path in paths for name in ("missing", "notexist")])
+
+
+def _run_intltool_update_m(backend, path):
+    """Run 'intltool-update -m' in `path`, returning True on success."""
     with open("/dev/null", "w") as devnull:
         try:
             backend.run(
                 ["/usr/bin/intltool-update", "-m"],
                 stdout=devnull, stderr=devnull, cwd=path)
+            return True
         except subprocess.CalledProcessError:
             return False
 
-    return not backend.path_exists(os.path.join(path, "notexist"))
-
 
 def find_intltool_dirs(backend, package_dir):
     """Search for directories with intltool structure.
@@ -82,9 +93,24 @@ def find_intltool_dirs(backend, package_dir):
     :param package_dir: The directory to search.
     :returns: A list of directory names, relative to `package_dir`.
     """
+    # This does the same as calling check_potfiles_in on each directory,
+    # but batches up the file checks.  The directories must exist, since
+    # find_potfiles_in found them.
+    podirs = find_potfiles_in(backend, package_dir)
+    if not podirs:
+        return []
+    _remove_intltool_update_files(
+        backend, [os.path.join(package_dir, podir) for podir in podirs])
+    podirs = [
+        podir for podir in podirs
+        if _run_intltool_update_m(backend, os.path.join(package_dir, podir))]
+    notexist_paths = {
+        podir: os.path.join(package_dir, podir, "notexist")
+        for podir in podirs}
+    stats = backend.stat_many(list(notexist_paths.values()))
     return sorted(
-        podir for podir in find_potfiles_in(backend, package_dir)
-        if check_potfiles_in(backend, os.path.join(package_dir, podir)))
+        podir for podir in podirs
+        if stats[notexist_paths[podir]] is None)
 
 
 def _get_AC_PACKAGE_NAME(config_file):
@@ -152,9 +178,12 @@ def get_translation_domain(backend, dirname):
     value = None
     substitution = None
     config_files = []
+    stats = backend.stat_many(
+        [os.path.join(dirname, filename) for filename, _, _ in locations])
     for filename, varname, keep_trying in locations:
         path = os.path.join(dirname, filename)
-        if not backend.path_exists(path):
+        path_stat = stats[path]
+        if path_stat is None or path_stat.target_type in ("N", "L"):
             # Skip non-existent files.
             continue
         with tempfile.NamedTemporaryFile() as local_file:
@@ -120,16 +120,19 @@ class SnapBuildManager(BuildManagerProxyMixin, DebianBuildManager):
     def gatherResults(self):
         """Gather the results of the build and add them to the file cache."""
         output_path = os.path.join("/build", self.name)
-        if self.backend.path_exists(output_path):
-            for entry in sorted(self.backend.listdir(output_path)):
-                path = os.path.join(output_path, entry)
-                if self.backend.islink(path):
-                    continue
-                if (entry.endswith(".snap") or entry.endswith(".manifest")
-                        or entry.endswith(".dpkg.yaml")):
-                    self.addWaitingFileFromBackend(path)
+        source_tarball_path = os.path.join("/build", "%s.tar.gz" % self.name)
+        stats = self.backend.stat_many([output_path, source_tarball_path])
+        # Skip anything that doesn't exist, including dangling links.
+        existing = {
+            path for path, path_stat in stats.items()
+            if path_stat is not None and
+            path_stat.target_type not in ("N", "L")}
+        if output_path in existing:
+            self.addWaitingFilesFromBackend(
+                output_path,
+                filter=lambda entry, _: entry.endswith(
+                    (".snap", ".manifest", ".dpkg.yaml")),
+                max_depth=1)
         if self.build_source_tarball:
-            source_tarball_path = os.path.join(
-                "/build", "%s.tar.gz" % self.name)
-            if self.backend.path_exists(source_tarball_path):
+            if source_tarball_path in existing:
                 self.addWaitingFileFromBackend(source_tarball_path)
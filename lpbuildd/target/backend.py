@@ -5,8 +5,11 @@ from __future__ import print_function
 
 __metaclass__ = type
 
+from collections import namedtuple
 import os.path
+import shutil
 import subprocess
+import tarfile
 
 
 class BackendException(Exception):
@@ -17,6 +20,55 @@ class InvalidBuildFilePath(Exception):
     pass
 
 
+# Information about a file in the target environment.  `type` and
+# `target_type` are as for find(1)'s "-type" test ("f", "d", "l", etc.);
+# `target_type` is the type after following any symbolic link, or "N" for a
+# dangling link.  `link_target` is empty unless the file is a symbolic link.
+BackendStat = namedtuple(
+    "BackendStat", ["type", "target_type", "size", "link_target"])
+
+# find(1) -printf directives for the fields of `BackendStat`.
+_stat_printf = "%y\\0%Y\\0%s\\0%l\\0"
+
+
+def _parse_stats(output):
+    # Parse the output of find(1) with "-printf" of a path directive
+    # followed by `_stat_printf`.
+    # XXX cjwatson 2017-08-04: Use `os.fsdecode` instead once we're on
+    # Python 3.
+    fields = [field.decode("UTF-8") for field in output.split(b"\0")[:-1]]
+    return {
+        fields[i]: BackendStat(
+            fields[i + 1], fields[i + 2], int(fields[i + 3]), fields[i + 4])
+        for i in range(0, len(fields), 5)}
+
+
+def stream_output(proc, cmd, consume):
+    """Pass the output of a running process to a callable as it arrives.
+
+    :param proc: a `subprocess.Popen` with a pipe for its stdout.
+    :param cmd: the command that `proc` is running, for error reporting.
+    :param consume: a callable taking a file object for the process's
+        output.
+    :raises subprocess.CalledProcessError: if the process fails.
+    :return: the return value of `consume`.
+    """
+    if proc.stdin is not None:
+        proc.stdin.close()
+    try:
+        result = consume(proc.stdout)
+    except Exception:
+        # Make sure that the process doesn't block writing to the pipe.
+        proc.stdout.close()
+        raise
+    finally:
+        proc.wait()
+        proc.stdout.close()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return result
+
+
 def check_path_escape(buildd_path, path_to_check):
     """Check the build file path doesn't escape the build directory."""
     build_file_path = os.path.realpath(
@@ -52,7 +104,7 @@ class Backend:
         raise NotImplementedError
 
     def run(self, args, cwd=None, env=None, input_text=None, get_output=False,
-            echo=False, **kwargs):
+            echo=False, return_process=False, **kwargs):
         """Run a command in the target environment.
 
         :param args: the command and arguments to run.
@@ -62,6 +114,10 @@ class Backend:
         :param get_output: if True, return the output from the command.
         :param echo: if True, print the command before executing it, and
             print any output from the command if `get_output` is also True.
+        :param return_process: if True and `get_output` is also True,
+            return the `subprocess.Popen` object immediately rather than
+            waiting for the command to finish, so that its output can be
+            streamed.  The caller is responsible for waiting for it.
         :param kwargs: additional keyword arguments for `subprocess.Popen`.
         """
         raise NotImplementedError
@@ -93,6 +149,107 @@ class Backend:
         """
         raise NotImplementedError
 
+    def copy_out_to_sink(self, source_path, sink):
+        """Copy a file out of the target environment into a sink.
+
+        This lets callers process a file's contents as they arrive, for
+        example to hash it, rather than reading it back from disk.
+
+        :param source_path: the path to the file that should be copied,
+            relative to the target environment's root.
+        :param sink: a file-like object to write the file's contents to.
+            It is not closed.
+        """
+        cmd = ["cat", source_path]
+        stream_output(
+            self.run(cmd, get_output=True, return_process=True), cmd,
+            lambda output: shutil.copyfileobj(output, sink, 256 * 1024))
+
+    def copy_out_tree(self, path, target_path, filter=None, max_depth=None,
+                      follow_links=False):
+        """Copy regular files in a directory tree out of the target.
+
+        Rather than copying files one at a time, this streams a tar archive
+        of all the selected files out of the target environment and
+        unpacks it as it arrives, so it only runs two commands in the
+        target however many files there are.  Symbolic links and other
+        special files are not copied, unless `follow_links` is True, in
+        which case links to regular files are copied as the files they
+        point to.
+
+        :param path: the path to the directory to copy from, relative to
+            the target environment's root.
+        :param target_path: the directory in the host system in which to
+            put the copied files; subdirectories are created as needed.
+        :param filter: if not None, a callable taking the path of a file
+            relative to `path` and its `BackendStat`, and returning True if
+            the file should be copied.
+        :param max_depth: as for `find`.
+        :param follow_links: if True, also copy symbolic links to regular
+            files.
+        :return: a sorted list of the paths of the copied files, relative
+            to both `path` and `target_path`.
+        """
+        def open_sink(name):
+            sink_path = os.path.join(target_path, name)
+            if not os.path.isdir(os.path.dirname(sink_path)):
+                os.makedirs(os.path.dirname(sink_path))
+            return open(sink_path, "wb")
+
+        return self.copy_out_tree_to_sinks(
+            path, open_sink, filter=filter, max_depth=max_depth,
+            follow_links=follow_links)
+
+    def copy_out_tree_to_sinks(self, path, open_sink, filter=None,
+                               max_depth=None, follow_links=False):
+        """Copy regular files in a directory tree out of the target.
+
+        This is like `copy_out_tree`, but rather than unpacking the files
+        into a directory, it writes each of them to a sink.
+
+        :param open_sink: a callable taking the path of a file relative to
+            `path` and returning a file-like object to write its contents
+            to.  Each sink is closed once the file has been written.
+        :return: a sorted list of the paths of the copied files, relative
+            to `path`.
+        """
+        entries = self.find_stat(
+            path, max_depth=max_depth, include_directories=False)
+        names = sorted(
+            entry for entry, entry_stat in entries.items()
+            if (entry_stat.target_type if follow_links
+                else entry_stat.type) == "f" and
+            (filter is None or filter(entry, entry_stat)))
+        if not names:
+            return []
+
+        def unpack(output):
+            wanted = set(names)
+            copied = []
+            with tarfile.open(fileobj=output, mode="r|") as tar:
+                for member in tar:
+                    # Only accept the files we asked for, which also
+                    # guards against paths escaping the caller's
+                    # destination.
+                    if not member.isreg() or member.name not in wanted:
+                        continue
+                    wanted.discard(member.name)
+                    source = tar.extractfile(member)
+                    sink = open_sink(member.name)
+                    try:
+                        shutil.copyfileobj(source, sink, 256 * 1024)
+                    finally:
+                        sink.close()
+                    copied.append(member.name)
+            return sorted(copied)
+
+        cmd = ["tar", "-C", path, "-cf", "-", "--no-recursion"]
+        if follow_links:
+            cmd.append("--dereference")
+        cmd += ["--"] + names
+        return stream_output(
+            self.run(cmd, get_output=True, return_process=True), cmd, unpack)
+
     def path_exists(self, path):
         """Test whether a path exists in the target environment.
 
@@ -129,6 +286,47 @@ class Backend:
         except subprocess.CalledProcessError:
             return False
 
+    def stat_many(self, paths):
+        """Look up information about several files at once.
+
+        This runs a single command in the target environment, so is much
+        cheaper than calling `path_exists`, `isdir` or `islink` for each
+        path.
+
+        :param paths: a list of absolute paths, relative to the target
+            environment's root.
+        :return: a dict mapping each of `paths` to a `BackendStat`, or to
+            None if it does not exist.  Symbolic links are not followed,
+            except to determine `BackendStat.target_type`.
+        """
+        stats = dict.fromkeys(paths)
+        if paths:
+            # find(1) exits non-zero if any of the paths do not exist, so
+            # only pass it the ones that do; any other failure is an error.
+            script = (
+                'for path; do shift; '
+                'if [ -e "$path" ] || [ -L "$path" ]; then '
+                'set -- "$@" "$path"; fi; done; '
+                '[ "$#" -eq 0 ] || '
+                'exec find "$@" -maxdepth 0 -printf "%%p\\0%s"' %
+                _stat_printf)
+            output = self.run(
+                ["/bin/sh", "-c", script, "sh"] + list(paths),
+                get_output=True)
+            stats.update(_parse_stats(output))
+        return stats
+
+    def _find_command(self, path, max_depth=None, include_directories=True,
+                      name=None):
+        cmd = ["find", path, "-mindepth", "1"]
+        if max_depth is not None:
+            cmd.extend(["-maxdepth", str(max_depth)])
+        if not include_directories:
+            cmd.extend(["!", "-type", "d"])
+        if name is not None:
+            cmd.extend(["-name", name])
+        return cmd
+
     def find(self, path, max_depth=None, include_directories=True, name=None):
         """Find entries in `path`.
 
@@ -140,19 +338,28 @@ class Backend:
             directories.
         :param name: only include entries whose name is equal to this.
         """
-        cmd = ["find", path, "-mindepth", "1"]
-        if max_depth is not None:
-            cmd.extend(["-maxdepth", str(max_depth)])
-        if not include_directories:
-            cmd.extend(["!", "-type", "d"])
-        if name is not None:
-            cmd.extend(["-name", name])
+        cmd = self._find_command(
+            path, max_depth=max_depth,
+            include_directories=include_directories, name=name)
         cmd.extend(["-printf", "%P\\0"])
         paths = self.run(cmd, get_output=True).split(b"\0")[:-1]
         # XXX cjwatson 2017-08-04: Use `os.fsdecode` instead once we're on
         # Python 3.
         return [p.decode("UTF-8") for p in paths]
 
+    def find_stat(self, path, max_depth=None, include_directories=True,
+                  name=None):
+        """Find entries in `path`, with information about each of them.
+
+        This takes the same arguments as `find`, but returns a dict mapping
+        each entry found to a `BackendStat`, all from a single command.
+        """
+        cmd = self._find_command(
+            path, max_depth=max_depth,
+            include_directories=include_directories, name=name)
+        cmd.extend(["-printf", "%P\\0" + _stat_printf])
+        return _parse_stats(self.run(cmd, get_output=True))
+
     def listdir(self, path):
         """List a directory in the target environment.
 
@@ -189,12 +396,46 @@ class Backend:
         """Stop the backend."""
         raise NotImplementedError
 
+    def warm_up(self):
+        """Do any set-up that later operations can share.
+
+        This is called in the in-target helper (see
+        `lpbuildd.target.helper`), whose children run operations.  It may
+        be called several times, and must not raise exceptions.
+        """
+        pass
+
+    def after_fork(self):
+        """Prepare to be used in a process forked from the helper.
+
+        Connections inherited from the helper must not be shared, since
+        operations may run concurrently.
+        """
+        pass
+
     def remove(self):
         """Remove the backend."""
         subprocess.check_call(["sudo", "rm", "-rf", self.build_path])
 
 
+# Backends shared by operations run from the in-target helper.
+_backend_cache = {}
+
+
+def cache_backend(name, backend):
+    """Make `make_backend` return `backend` for the same arguments.
+
+    This is only appropriate in the in-target helper, which runs
+    operations for a single build.
+    """
+    _backend_cache[
+        (name, backend.build_id, backend.series, backend.arch)] = backend
+
+
 def make_backend(name, build_id, series=None, arch=None):
+    cached = _backend_cache.get((name, build_id, series, arch))
+    if cached is not None:
+        return cached
     if name == "chroot":
         from lpbuildd.target.chroot import Chroot
         backend_factory = Chroot
@@ -6,6 +6,7 @@ from __future__ import print_function
 __metaclass__ = type
 
 import os.path
+import shutil
 import signal
 import stat
 import subprocess
@@ -16,6 +17,7 @@ import six
 from lpbuildd.target.backend import (
     Backend,
     BackendException,
+    stream_output,
     )
 from lpbuildd.util import (
     set_personality,
@@ -58,7 +60,7 @@ class Chroot(Backend):
             self.copy_in(path, path)
 
     def run(self, args, cwd=None, env=None, input_text=None, get_output=False,
-            echo=False, **kwargs):
+            echo=False, return_process=False, **kwargs):
         """See `Backend`."""
         if env:
             args = ["env"] + [
@@ -89,6 +91,8 @@ class Chroot(Backend):
             if get_output:
                 kwargs["stdout"] = subprocess.PIPE
             proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, **kwargs)
+            if return_process:
+                return proc
             output, _ = proc.communicate(input_text)
             if proc.returncode:
                 raise subprocess.CalledProcessError(proc.returncode, cmd)
@@ -122,6 +126,16 @@ class Chroot(Backend):
             ["sudo", "cp", "--preserve=timestamps",
              full_source_path, target_path])
 
+    def copy_out_to_sink(self, source_path, sink):
+        """See `Backend`."""
+        # As with copy_out, read the file from outside the chroot.
+        full_source_path = os.path.join(
+            self.chroot_path, source_path.lstrip("/"))
+        cmd = ["sudo", "cat", full_source_path]
+        stream_output(
+            subprocess.Popen(cmd, stdout=subprocess.PIPE), cmd,
+            lambda output: shutil.copyfileobj(output, sink, 256 * 1024))
+
     def kill_processes(self):
         """See `Backend`."""
         prefix = os.path.realpath(self.chroot_path)
@@ -6,33 +6,10 @@ from __future__ import print_function
 __metaclass__ = type
 
 from argparse import ArgumentParser
+import importlib
 import logging
 import sys
 
-from lpbuildd.target.apt import (
-    AddTrustedKeys,
-    OverrideSourcesList,
-    Update,
-    )
-from lpbuildd.target.build_charm import BuildCharm
-from lpbuildd.target.build_oci import BuildOCI
-from lpbuildd.target.build_livefs import BuildLiveFS
-from lpbuildd.target.build_snap import BuildSnap
-from lpbuildd.target.generate_translation_templates import (
-    GenerateTranslationTemplates,
-    )
-from lpbuildd.target.lifecycle import (
-    Create,
-    KillProcesses,
-    Remove,
-    Start,
-    Stop,
-    )
-from lpbuildd.target.run_ci import (
-    RunCI,
-    RunCIPrepare,
-    )
-
 
 def configure_logging():
     class StdoutFilter(logging.Filter):
@@ -53,29 +30,53 @@ def configure_logging():
     logger.setLevel(logging.INFO)
 
 
+# Operations are imported only when needed, since in-target is run
+# several times for every build and some operations have expensive
+# dependencies.
 operations = {
-    "add-trusted-keys": AddTrustedKeys,
-    "build-oci": BuildOCI,
-    "build-charm": BuildCharm,
-    "buildlivefs": BuildLiveFS,
-    "buildsnap": BuildSnap,
-    "generate-translation-templates": GenerateTranslationTemplates,
-    "override-sources-list": OverrideSourcesList,
-    "mount-chroot": Start,
-    "remove-build": Remove,
-    "run-ci": RunCI,
-    "run-ci-prepare": RunCIPrepare,
-    "scan-for-processes": KillProcesses,
-    "umount-chroot": Stop,
-    "unpack-chroot": Create,
-    "update-debian-chroot": Update,
+    "add-trusted-keys": ("lpbuildd.target.apt", "AddTrustedKeys"),
+    "build-oci": ("lpbuildd.target.build_oci", "BuildOCI"),
+    "build-charm": ("lpbuildd.target.build_charm", "BuildCharm"),
+    "buildlivefs": ("lpbuildd.target.build_livefs", "BuildLiveFS"),
+    "buildsnap": ("lpbuildd.target.build_snap", "BuildSnap"),
+    "generate-translation-templates": (
+        "lpbuildd.target.generate_translation_templates",
+        "GenerateTranslationTemplates"),
+    "override-sources-list": (
+        "lpbuildd.target.apt", "OverrideSourcesList"),
+    "mount-chroot": ("lpbuildd.target.lifecycle", "Start"),
+    "remove-build": ("lpbuildd.target.lifecycle", "Remove"),
+    "run-ci": ("lpbuildd.target.run_ci", "RunCI"),
+    "run-ci-prepare": ("lpbuildd.target.run_ci", "RunCIPrepare"),
+    "scan-for-processes": ("lpbuildd.target.lifecycle", "KillProcesses"),
+    "serve-operations": ("lpbuildd.target.helper", "ServeOperations"),
+    "umount-chroot": ("lpbuildd.target.lifecycle", "Stop"),
+    "unpack-chroot": ("lpbuildd.target.lifecycle", "Create"),
+    "update-debian-chroot": ("lpbuildd.target.apt", "Update"),
     }
 
 
+def get_operation(name):
+    """Import and return the factory for an operation."""
+    module_name, factory_name = operations[name]
+    return getattr(importlib.import_module(module_name), factory_name)
+
+
 def parse_args(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    # in-target has no global options that take values, so the first
+    # non-option argument is the operation.  If it is a known one, only
+    # that operation's module is imported; otherwise we import all of
+    # them so that help and error messages are complete.
+    chosen = next((arg for arg in args if not arg.startswith("-")), None)
     parser = ArgumentParser(description="Run an operation in the target.")
     subparsers = parser.add_subparsers(metavar="OPERATION")
-    for name, factory in sorted(operations.items()):
+    for name in sorted(operations):
+        if chosen in operations and name != chosen:
+            subparsers.add_parser(name)
+            continue
+        factory = get_operation(name)
         subparser = subparsers.add_parser(
             name, description=factory.description, help=factory.description)
         factory.add_arguments(subparser)
@@ -0,0 +1,274 @@
+# Copyright 2026 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""A long-lived helper that runs in-target operations for a build.
+
+Starting a fresh in-target process for each phase of a build means
+importing all its dependencies and building a new backend each time.  The
+helper does that once, and then forks a child for each operation the
+build manager sends it, so each operation starts with the backend built,
+architecture lookups done, (for LXD) the client connected, and the
+modules for operations that every build runs imported.  Other operations
+are imported in the child that runs them, as they would be by in-target.
+
+The build manager passes a listening Unix socket as file descriptor 3 and
+connects to it once per operation.  Messages in both directions are
+frames consisting of a one-byte type, a four-byte big-endian length and a
+payload:
+
+  R (to helper): JSON request {"args": [...]}, the in-target arguments
+  I (to helper): data for the operation's stdin; always sent, possibly
+      empty
+  K (to helper): kill the operation with the given signal number
+  O (from helper): output from the operation
+  X (from helper): JSON {"exit_code": N} or {"signal": N} once the
+      operation has finished
+
+The helper exits when its stdin is closed.
+"""
+
+from __future__ import print_function
+
+__metaclass__ = type
+
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import traceback
+
+from lpbuildd.target.operation import Operation
+from lpbuildd.target.backend import cache_backend
+from lpbuildd.util import get_arch_bits
+
+
+FRAME_HEADER = struct.Struct(">cI")
+
+# Operations that every build runs, and whose modules are therefore worth
+# importing before forking.  Others are imported when first needed, as
+# with a fresh in-target process; importing them up front would pull in
+# dependencies (requests, and so on) that most builds never use.
+COMMON_OPERATIONS = (
+    "mount-chroot",
+    "override-sources-list",
+    "remove-build",
+    "scan-for-processes",
+    "umount-chroot",
+    "unpack-chroot",
+    "update-debian-chroot",
+    )
+
+
+def pack_frame(kind, payload=b""):
+    """Return a frame of type `kind` with the given payload."""
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+class FrameDecoder:
+    """Split a stream of bytes into frames."""
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, data):
+        """Add some bytes, returning a list of any complete frames.
+
+        :return: A list of (type, payload) tuples.
+        """
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= FRAME_HEADER.size:
+            kind, length = FRAME_HEADER.unpack_from(self._buffer)
+            end = FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            frames.append((kind, self._buffer[FRAME_HEADER.size:end]))
+            self._buffer = self._buffer[end:]
+        return frames
+
+
+def _exit_status(result):
+    # Convert an operation's return value (or SystemExit code) to an exit
+    # status in the same way as sys.exit.
+    if result is None:
+        return 0
+    elif isinstance(result, int):
+        return result
+    else:
+        print(result, file=sys.stderr)
+        return 1
+
+
+def _write_all(fd, data):
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _run_operation(args):
+    # Runs in the forked operation process.
+    from lpbuildd.target.cli import parse_args
+    try:
+        status = _exit_status(parse_args(args=args).operation.run())
+    except SystemExit as e:
+        status = _exit_status(e.code)
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return status
+
+
+def serve_connection(conn, backend):
+    """Run a single operation requested over `conn`.
+
+    This runs in a child of the main helper process.
+    """
+    decoder = FrameDecoder()
+    frames = []
+    while len(frames) < 2:
+        data = conn.recv(65536)
+        if not data:
+            return 1
+        frames.extend(decoder.feed(data))
+    (_, request), (_, stdin_data) = frames[:2]
+    args = json.loads(request.decode("UTF-8"))["args"]
+
+    out_r, out_w = os.pipe()
+    in_r, in_w = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            conn.close()
+            backend.after_fork()
+            os.dup2(in_r, 0)
+            os.dup2(out_w, 1)
+            os.dup2(out_w, 2)
+            for fd in (in_r, in_w, out_r, out_w):
+                os.close(fd)
+            status = _run_operation(args)
+        finally:
+            os._exit(status)
+    os.close(in_r)
+    os.close(out_w)
+    writer = threading.Thread(target=_write_all, args=(in_w, stdin_data))
+    writer.daemon = True
+    writer.start()
+
+    for kind, payload in frames[2:]:
+        if kind == b"K":
+            os.kill(pid, int(payload))
+    connected = True
+    while True:
+        readable, _, _ = select.select(
+            [out_r, conn] if connected else [out_r], [], [])
+        if conn in readable:
+            try:
+                data = conn.recv(65536)
+            except socket.error:
+                data = b""
+            if not data:
+                # The build manager no longer cares.  Close the output
+                # pipe as a pipe-connected subprocess's would be.
+                connected = False
+                break
+            for kind, payload in decoder.feed(data):
+                if kind == b"K":
+                    os.kill(pid, int(payload))
+        if out_r in readable:
+            data = os.read(out_r, 65536)
+            if not data:
+                break
+            try:
+                conn.sendall(pack_frame(b"O", data))
+            except socket.error:
+                connected = False
+                break
+    os.close(out_r)
+    _, wait_status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(wait_status):
+        result = {"signal": os.WTERMSIG(wait_status)}
+    else:
+        result = {"exit_code": os.WEXITSTATUS(wait_status)}
+    if connected:
+        try:
+            conn.sendall(
+                pack_frame(b"X", json.dumps(result).encode("UTF-8")))
+        except socket.error:
+            pass
+    conn.close()
+    return 0
+
+
+class ServeOperations(Operation):
+
+    description = "Serve operations for a build over a socket."
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super(ServeOperations, cls).add_arguments(parser)
+        parser.add_argument(
+            "--socket-fd", type=int, default=3,
+            help="accept connections on the listening socket with this file "
+                 "descriptor")
+
+    def warm_up(self):
+        """Do expensive set-up that every operation can share."""
+        from lpbuildd.target.cli import get_operation
+        for name in COMMON_OPERATIONS:
+            get_operation(name)
+        if self.args.arch is not None:
+            try:
+                get_arch_bits(self.args.arch)
+            except Exception:
+                pass
+        cache_backend(self.args.backend, self.backend)
+        self.backend.warm_up()
+
+    def run(self):
+        self.warm_up()
+        listener = socket.fromfd(
+            self.args.socket_fd, socket.AF_UNIX, socket.SOCK_STREAM)
+        os.close(self.args.socket_fd)
+        children = set()
+        try:
+            while True:
+                readable, _, _ = select.select([listener, 0], [], [], 1.0)
+                if 0 in readable and not os.read(0, 4096):
+                    break
+                if listener in readable:
+                    conn, _ = listener.accept()
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    pid = os.fork()
+                    if pid == 0:
+                        status = 1
+                        try:
+                            listener.close()
+                            status = serve_connection(conn, self.backend)
+                        except Exception:
+                            traceback.print_exc()
+                        finally:
+                            os._exit(status)
+                    conn.close()
+                    children.add(pid)
+                for pid in list(children):
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        children.discard(pid)
+                        # Earlier operations may have made it possible to
+                        # do more set-up, e.g. connecting to LXD.
+                        self.backend.warm_up()
+        finally:
+            listener.close()
+        return 0
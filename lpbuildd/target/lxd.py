@@ -125,6 +125,20 @@ class LXD(Backend):
             self._client = pylxd.Client()
         return self._client
 
+    def warm_up(self):
+        """See `Backend`."""
+        # Connecting to LXD fails until `create` has set up a client
+        # certificate; that's fine, since we'll be asked again later.
+        try:
+            self.client
+        except Exception:
+            self._client = None
+
+    def after_fork(self):
+        """See `Backend`."""
+        if self._client is not None:
+            self._client.api.session.close()
+
     @property
     def lxc_arch(self):
         return self.arches[self.arch]
@@ -589,22 +603,26 @@ class LXD(Backend):
         return response
 
     def copy_out(self, source_path, target_path):
+        """See `Backend`."""
+        # This ignores UID/GID/mode, but then so does "lxc file pull".
+        with open(target_path, "wb") as target_file:
+            self.copy_out_to_sink(source_path, target_file)
+
+    def copy_out_to_sink(self, source_path, sink):
+        """See `Backend`."""
         # pylxd's FilesManager doesn't support streaming, which is important
         # since copied-out files may be large.
-        # This ignores UID/GID/mode, but then so does "lxc file pull".
         container = self.client.containers.get(self.name)
-        with open(target_path, "wb") as target_file:
-            params = {"path": source_path}
-            try:
-                with closing(
-                        self._get_file(
-                            container, params=params,
-                            stream=True)) as response:
-                    for chunk in response.iter_content(chunk_size=65536):
-                        target_file.write(chunk)
-            except LXDAPIException as e:
-                raise LXDException(
-                    "Failed to pull %s:%s" % (self.name, source_path), e)
+        params = {"path": source_path}
+        try:
+            with closing(
+                    self._get_file(
+                        container, params=params, stream=True)) as response:
+                for chunk in response.iter_content(chunk_size=65536):
+                    sink.write(chunk)
+        except LXDAPIException as e:
+            raise LXDException(
+                "Failed to pull %s:%s" % (self.name, source_path), e)
 
     def stop(self):
         """See `Backend`."""
@@ -0,0 +1,67 @@
+# Copyright 2026 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Benchmark in-target start-up time.
+
+This compares the time taken to start Python and parse arguments for
+each operation with the time taken when all operation modules are
+imported up front, as in-target used to do.
+
+Usage: python -m lpbuildd.target.tests.benchmark_cli [RUNS]
+"""
+
+from __future__ import print_function
+
+__metaclass__ = type
+
+import os
+import subprocess
+import sys
+import time
+
+import lpbuildd
+
+
+lazy_script = """\
+from lpbuildd.target.cli import parse_args
+parse_args(args=%r)
+"""
+
+eager_script = """\
+from lpbuildd.target.cli import get_operation, operations, parse_args
+for name in operations:
+    get_operation(name)
+parse_args(args=%r)
+"""
+
+
+def timed_runs(script, runs, env):
+    start = time.time()
+    for _ in range(runs):
+        subprocess.check_call([sys.executable, "-c", script], env=env)
+    return (time.time() - start) / runs
+
+
+def main(argv):
+    runs = int(argv[1]) if len(argv) > 1 else 10
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(
+        os.path.dirname(os.path.abspath(lpbuildd.__file__)))
+    common = ["--backend=fake", "--series=xenial", "--arch=amd64", "1"]
+    extra_args = {
+        "unpack-chroot": ["/path/to/tarball"],
+        "override-sources-list": [
+            "deb http://archive.example/ubuntu xenial main"],
+        }
+    for name in ("unpack-chroot", "mount-chroot", "override-sources-list",
+                 "update-debian-chroot", "scan-for-processes",
+                 "umount-chroot", "remove-build"):
+        args = [name] + common + extra_args.get(name, [])
+        eager = timed_runs(eager_script % (args,), runs, env)
+        lazy = timed_runs(lazy_script % (args,), runs, env)
+        print("%-22s eager %6.1fms  lazy %6.1fms" % (
+            name, eager * 1000, lazy * 1000))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -6,6 +6,8 @@ __metaclass__ = type
 import io
 import os.path
 import signal
+import subprocess
+import tarfile
 from textwrap import dedent
 import time
 
@@ -21,7 +23,10 @@ from systemfixtures import (
 from testtools import TestCase
 from testtools.matchers import DirContains
 
-from lpbuildd.target.backend import BackendException
+from lpbuildd.target.backend import (
+    BackendException,
+    BackendStat,
+    )
 from lpbuildd.target.chroot import Chroot
 from lpbuildd.target.tests.testfixtures import (
     CarefulFakeProcessFixture,
@@ -193,6 +198,100 @@ class TestChroot(TestCase):
             expected_args,
             [proc._args["args"] for proc in processes_fixture.procs])
 
+    def test_copy_out_to_sink(self):
+        self.useFixture(EnvironmentVariable("HOME", "/expected/home"))
+        processes_fixture = self.useFixture(FakeProcesses())
+        processes_fixture.add(
+            lambda _: {"stdout": io.BytesIO(b"contents")}, name="sudo")
+        sink = io.BytesIO()
+        Chroot("1", "xenial", "amd64").copy_out_to_sink(
+            "/path/to/source", sink)
+        self.assertEqual(b"contents", sink.getvalue())
+
+        expected_args = [
+            ["sudo", "cat",
+             "/expected/home/build-1/chroot-autobuild/path/to/source"],
+            ]
+        self.assertEqual(
+            expected_args,
+            [proc._args["args"] for proc in processes_fixture.procs])
+
+    def test_copy_out_tree(self):
+        self.useFixture(EnvironmentVariable("HOME", "/expected/home"))
+        target = self.useFixture(TempDir()).path
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for name, data in (("a/b", b"nested"), ("c", b"top")):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        processes_fixture = self.useFixture(FakeProcesses())
+        test_proc_infos = iter([
+            {"stdout": io.BytesIO(
+                b"a/b\0f\0f\0" b"6\0\0"
+                b"c\0f\0f\0" b"3\0\0"
+                b"d\0f\0f\0" b"0\0\0"
+                b"link\0l\0f\0" b"1\0c\0")},
+            {"stdout": io.BytesIO(archive.getvalue())},
+            ])
+        processes_fixture.add(lambda _: next(test_proc_infos), name="sudo")
+        self.assertEqual(
+            ["a/b", "c"],
+            Chroot("1", "xenial", "amd64").copy_out_tree(
+                "/path", target, filter=lambda entry, _: entry != "d"))
+        self.assertThat(target, DirContains(["a", "c"]))
+        with open(os.path.join(target, "a", "b"), "rb") as f:
+            self.assertEqual(b"nested", f.read())
+
+        chroot_prefix = [
+            "sudo", "/usr/sbin/chroot",
+            "/expected/home/build-1/chroot-autobuild", "linux64",
+            ]
+        expected_args = [
+            chroot_prefix + [
+                "find", "/path", "-mindepth", "1", "!", "-type", "d",
+                "-printf", "%P\\0%y\\0%Y\\0%s\\0%l\\0"],
+            chroot_prefix + [
+                "tar", "-C", "/path", "-cf", "-", "--no-recursion", "--",
+                "a/b", "c"],
+            ]
+        self.assertEqual(
+            expected_args,
+            [proc._args["args"] for proc in processes_fixture.procs])
+
+    def test_copy_out_tree_follow_links(self):
+        self.useFixture(EnvironmentVariable("HOME", "/expected/home"))
+        target = self.useFixture(TempDir()).path
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for name, data in (("c", b"top"), ("link", b"top")):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        processes_fixture = self.useFixture(FakeProcesses())
+        test_proc_infos = iter([
+            {"stdout": io.BytesIO(
+                b"c\0f\0f\0" b"3\0\0"
+                b"dangling\0l\0N\0" b"7\0missing\0"
+                b"link\0l\0f\0" b"1\0c\0")},
+            {"stdout": io.BytesIO(archive.getvalue())},
+            ])
+        processes_fixture.add(lambda _: next(test_proc_infos), name="sudo")
+        self.assertEqual(
+            ["c", "link"],
+            Chroot("1", "xenial", "amd64").copy_out_tree(
+                "/path", target, follow_links=True))
+        self.assertThat(target, DirContains(["c", "link"]))
+        with open(os.path.join(target, "link"), "rb") as f:
+            self.assertEqual(b"top", f.read())
+
+        self.assertEqual(
+            ["sudo", "/usr/sbin/chroot",
+             "/expected/home/build-1/chroot-autobuild", "linux64",
+             "tar", "-C", "/path", "-cf", "-", "--no-recursion",
+             "--dereference", "--", "c", "link"],
+            processes_fixture.procs[-1]._args["args"])
+
     def test_path_exists(self):
         self.useFixture(EnvironmentVariable("HOME", "/expected/home"))
         processes_fixture = self.useFixture(FakeProcesses())
@@ -311,6 +410,71 @@ class TestChroot(TestCase):
             expected_args,
             [proc._args["args"] for proc in processes_fixture.procs])
 
+    def test_stat_many(self):
+        self.useFixture(EnvironmentVariable("HOME", "/expected/home"))
+        processes_fixture = self.useFixture(FakeProcesses())
+        processes_fixture.add(
+            lambda _: {"stdout": io.BytesIO(
+                b"/dir\0d\0d\0" b"4096\0\0"
+                b"/link\0l\0f\0" b"4\0file\0")},
+            name="sudo")
+        self.assertEqual(
+            {"/dir": BackendStat("d", "d", 4096, ""),
+             "/link": BackendStat("l", "f", 4, "file"),
+             "/absent": None},
+            Chroot("1", "xenial", "amd64").stat_many(
+                ["/dir", "/link", "/absent"]))
+        self.assertEqual({}, Chroot("1", "xenial", "amd64").stat_many([]))
+
+        expected_args = [
+            ["sudo", "/usr/sbin/chroot",
+             "/expected/home/build-1/chroot-autobuild",
+             "linux64", "/bin/sh", "-c",
+             'for path; do shift; '
+             'if [ -e "$path" ] || [ -L "$path" ]; then '
+             'set -- "$@" "$path"; fi; done; '
+             '[ "$#" -eq 0 ] || '
+             'exec find "$@" -maxdepth 0 '
+             '-printf "%p\\0%y\\0%Y\\0%s\\0%l\\0"',
+             "sh", "/dir", "/link", "/absent"],
+            ]
+        self.assertEqual(
+            expected_args,
+            [proc._args["args"] for proc in processes_fixture.procs])
+
+    def test_stat_many_error(self):
+        # Failures other than missing paths are not hidden.
+        self.useFixture(EnvironmentVariable("HOME", "/expected/home"))
+        processes_fixture = self.useFixture(FakeProcesses())
+        processes_fixture.add(lambda _: {"returncode": 1}, name="sudo")
+        self.assertRaises(
+            subprocess.CalledProcessError,
+            Chroot("1", "xenial", "amd64").stat_many, ["/dir"])
+
+    def test_find_stat(self):
+        self.useFixture(EnvironmentVariable("HOME", "/expected/home"))
+        processes_fixture = self.useFixture(FakeProcesses())
+        processes_fixture.add(
+            lambda _: {"stdout": io.BytesIO(
+                b"foo\0f\0f\0" b"3\0\0"
+                b"bar\0l\0N\0" b"7\0missing\0")},
+            name="sudo")
+        self.assertEqual(
+            {"foo": BackendStat("f", "f", 3, ""),
+             "bar": BackendStat("l", "N", 7, "missing")},
+            Chroot("1", "xenial", "amd64").find_stat(
+                "/path", include_directories=False))
+
+        expected_args = [
+            ["sudo", "/usr/sbin/chroot",
+             "/expected/home/build-1/chroot-autobuild",
+             "linux64", "find", "/path", "-mindepth", "1", "!", "-type", "d",
+             "-printf", "%P\\0%y\\0%Y\\0%s\\0%l\\0"],
+            ]
+        self.assertEqual(
+            expected_args,
+            [proc._args["args"] for proc in processes_fixture.procs])
+
     def test_is_package_available(self):
         self.useFixture(EnvironmentVariable("HOME", "/expected/home"))
         processes_fixture = self.useFixture(FakeProcesses())
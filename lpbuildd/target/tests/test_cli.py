@@ -0,0 +1,57 @@
+# Copyright 2026 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+__metaclass__ = type
+
+import os
+import subprocess
+import sys
+
+from testtools import TestCase
+
+import lpbuildd
+from lpbuildd.target.cli import (
+    get_operation,
+    operations,
+    parse_args,
+    )
+from lpbuildd.target.lifecycle import Start
+
+
+class TestParseArgs(TestCase):
+
+    def test_all_operations_importable(self):
+        for name in operations:
+            self.assertTrue(
+                hasattr(get_operation(name), "add_arguments"), name)
+
+    def test_operation(self):
+        args = parse_args(args=[
+            "mount-chroot",
+            "--backend=fake", "--series=xenial", "--arch=amd64", "1",
+            ])
+        self.assertIsInstance(args.operation, Start)
+
+    def test_only_imports_chosen_operation(self):
+        # Parsing arguments for one operation doesn't import the modules
+        # implementing the others.
+        script = (
+            "import sys\n"
+            "from lpbuildd.target.cli import parse_args\n"
+            "parse_args(args=['scan-for-processes', '--backend=fake', "
+            "'--series=xenial', '--arch=amd64', '1'])\n"
+            "print(' '.join(sorted(\n"
+            "    name for name in sys.modules\n"
+            "    if name.startswith('lpbuildd.target.'))))\n")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(
+            os.path.dirname(os.path.abspath(lpbuildd.__file__)))
+        output = subprocess.check_output(
+            [sys.executable, "-c", script], env=env,
+            universal_newlines=True)
+        modules = output.split()
+        self.assertIn("lpbuildd.target.lifecycle", modules)
+        for name in (
+                "lpbuildd.target.build_charm", "lpbuildd.target.build_snap",
+                "lpbuildd.target.run_ci"):
+            self.assertNotIn(name, modules)
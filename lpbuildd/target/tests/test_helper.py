@@ -0,0 +1,263 @@
+# Copyright 2026 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+__metaclass__ = type
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from fixtures import (
+    MonkeyPatch,
+    TempDir,
+    )
+from testtools import TestCase
+
+import lpbuildd
+from lpbuildd.target.cli import parse_args
+from lpbuildd.target.helper import (
+    FrameDecoder,
+    pack_frame,
+    serve_connection,
+    )
+from lpbuildd.tests.fakebuilder import FakeMethod
+
+
+def fake_run_operation(args):
+    """Stand in for running an in-target operation.
+
+    "echo STATUS" copies stdin to stdout and returns STATUS; "sleep" sleeps
+    until killed; "spew" writes output until it can't.
+    """
+    if args[0] == "echo":
+        for data in iter(lambda: os.read(0, 65536), b""):
+            os.write(1, data)
+        return int(args[1])
+    elif args[0] == "sleep":
+        time.sleep(60)
+        return 0
+    elif args[0] == "spew":
+        while True:
+            os.write(1, b"x" * 65536)
+
+
+def wait_for_exit(pid, timeout=10):
+    """Wait for a child process to exit, killing it after `timeout`.
+
+    :return: The child's wait status, or None if it had to be killed.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        waited_pid, status = os.waitpid(pid, os.WNOHANG)
+        if waited_pid:
+            return status
+        time.sleep(0.01)
+    os.kill(pid, 9)
+    os.waitpid(pid, 0)
+    return None
+
+
+def receive_frames(sock):
+    """Read frames from `sock` until the other end closes it."""
+    decoder = FrameDecoder()
+    frames = []
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return frames
+        frames.extend(decoder.feed(data))
+
+
+def request(*args):
+    return pack_frame(b"R", json.dumps({"args": list(args)}).encode("UTF-8"))
+
+
+class TestFrames(TestCase):
+
+    def test_pack_frame(self):
+        self.assertEqual(b"O\0\0\0\x03abc", pack_frame(b"O", b"abc"))
+        self.assertEqual(b"I\0\0\0\0", pack_frame(b"I"))
+
+    def test_partial_frames(self):
+        decoder = FrameDecoder()
+        data = pack_frame(b"O", b"hello") + pack_frame(b"I")
+        frames = []
+        for i in range(len(data)):
+            frames.extend(decoder.feed(data[i:i + 1]))
+            if i < 9:
+                self.assertEqual([], frames)
+        self.assertEqual([(b"O", b"hello"), (b"I", b"")], frames)
+
+    def test_concatenated_frames(self):
+        decoder = FrameDecoder()
+        data = (
+            pack_frame(b"R", b"request") + pack_frame(b"I", b"input") +
+            pack_frame(b"K", b"9"))
+        self.assertEqual(
+            [(b"R", b"request"), (b"I", b"input")],
+            decoder.feed(data[:-3]))
+        self.assertEqual([(b"K", b"9")], decoder.feed(data[-3:]))
+
+
+class TestServeConnection(TestCase):
+
+    def setUp(self):
+        super(TestServeConnection, self).setUp()
+        self.useFixture(MonkeyPatch(
+            "lpbuildd.target.helper._run_operation", fake_run_operation))
+        self.backend = FakeMethod()
+        self.backend.after_fork = FakeMethod()
+
+    def serve(self):
+        """Serve a connection in a child process, as the helper does.
+
+        :return: The client's end of the connection, and the child's pid.
+        """
+        client, server = socket.socketpair()
+        self.addCleanup(client.close)
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                client.close()
+                status = serve_connection(server, self.backend)
+            finally:
+                os._exit(status)
+        server.close()
+        return client, pid
+
+    def test_runs_operation(self):
+        client, pid = self.serve()
+        client.sendall(request("echo", "3") + pack_frame(b"I", b"hello\n"))
+        frames = receive_frames(client)
+        self.assertEqual(
+            b"hello\n",
+            b"".join(payload for kind, payload in frames if kind == b"O"))
+        self.assertEqual(
+            (b"X", {"exit_code": 3}),
+            (frames[-1][0], json.loads(frames[-1][1].decode("UTF-8"))))
+        self.assertEqual(0, wait_for_exit(pid))
+
+    def test_kill(self):
+        client, pid = self.serve()
+        client.sendall(request("sleep") + pack_frame(b"I"))
+        time.sleep(0.1)
+        client.sendall(pack_frame(b"K", b"9"))
+        self.assertEqual(
+            [(b"X", b'{"signal": 9}')], receive_frames(client))
+        self.assertEqual(0, wait_for_exit(pid))
+
+    def test_kill_with_request(self):
+        # A kill frame may arrive in the same read as the request.
+        client, pid = self.serve()
+        client.sendall(
+            request("sleep") + pack_frame(b"I") + pack_frame(b"K", b"15"))
+        self.assertEqual(
+            [(b"X", b'{"signal": 15}')], receive_frames(client))
+        self.assertEqual(0, wait_for_exit(pid))
+
+    def test_client_disconnects(self):
+        # If the client goes away mid-operation, the operation's output
+        # pipe is closed, and the operation is waited for.
+        client, pid = self.serve()
+        client.sendall(request("spew") + pack_frame(b"I"))
+        self.assertNotEqual(b"", client.recv(65536))
+        client.close()
+        self.assertEqual(0, wait_for_exit(pid))
+
+    def test_client_disconnects_before_request(self):
+        client, pid = self.serve()
+        client.close()
+        status = wait_for_exit(pid)
+        self.assertTrue(os.WIFEXITED(status))
+        self.assertEqual(1, os.WEXITSTATUS(status))
+
+
+class TestServeOperations(TestCase):
+
+    def setUp(self):
+        super(TestServeOperations, self).setUp()
+        self.useFixture(MonkeyPatch(
+            "lpbuildd.target.helper._run_operation", fake_run_operation))
+
+    def start(self):
+        """Start serving operations in a child process.
+
+        :return: The path to the helper's socket, the write end of its
+            stdin, and its pid.
+        """
+        tempdir = self.useFixture(TempDir()).path
+        path = os.path.join(tempdir, "socket")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+        args = [
+            "serve-operations",
+            "--backend=fake", "--series=xenial", "--arch=amd64", "1",
+            "--socket-fd", str(listener.fileno()),
+            ]
+        serve = parse_args(args=args).operation
+        stdin_r, stdin_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(stdin_w)
+                os.dup2(stdin_r, 0)
+                status = serve.run()
+            finally:
+                os._exit(status)
+        listener.close()
+        os.close(stdin_r)
+        return path, stdin_w, pid
+
+    def test_serves_operations_until_stdin_closed(self):
+        path, stdin_w, pid = self.start()
+        for status in (0, 2):
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.addCleanup(client.close)
+            client.connect(path)
+            client.sendall(
+                request("echo", str(status)) + pack_frame(b"I", b"hi\n"))
+            self.assertEqual(
+                [(b"O", b"hi\n"),
+                 (b"X", json.dumps({"exit_code": status}).encode("UTF-8"))],
+                receive_frames(client))
+        os.close(stdin_w)
+        self.assertEqual(0, wait_for_exit(pid))
+
+    def test_stdin_eof_stops_loop(self):
+        path, stdin_w, pid = self.start()
+        os.close(stdin_w)
+        self.assertEqual(0, wait_for_exit(pid))
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(client.close)
+        self.assertRaises(socket.error, client.connect, path)
+
+    def test_warm_up_imports_only_common_operations(self):
+        # Operations that only some builds run are left to be imported
+        # when needed.
+        script = (
+            "import sys\n"
+            "from lpbuildd.target.cli import parse_args\n"
+            "parse_args(args=['serve-operations', '--backend=fake', "
+            "'--series=xenial', '--arch=amd64', '1']).operation.warm_up()\n"
+            "print(' '.join(sorted(\n"
+            "    name for name in sys.modules\n"
+            "    if name.startswith('lpbuildd.target.'))))\n")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(
+            os.path.dirname(os.path.abspath(lpbuildd.__file__)))
+        output = subprocess.check_output(
+            [sys.executable, "-c", script], env=env,
+            universal_newlines=True)
+        modules = output.split()
+        self.assertIn("lpbuildd.target.apt", modules)
+        self.assertIn("lpbuildd.target.lifecycle", modules)
+        for name in (
+                "lpbuildd.target.build_charm", "lpbuildd.target.build_snap",
+                "lpbuildd.target.run_ci"):
+            self.assertNotIn(name, modules)
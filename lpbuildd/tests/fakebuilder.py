@@ -21,7 +21,11 @@ from six.moves.configparser import (
     NoSectionError,
     )
 
-from lpbuildd.target.backend import Backend
+from lpbuildd.filecache import CacheFileWriter
+from lpbuildd.target.backend import (
+    Backend,
+    BackendStat,
+    )
 from lpbuildd.util import (
     set_personality,
     shell_escape,
@@ -90,13 +94,12 @@ class FakeConfig:
     def get(self, section, key):
         if key in self._overrides[section]:
             return self._overrides[section][key]
-        elif section == "proxy":
-            if not self._overrides[section]:
-                raise NoSectionError(section)
-            else:
-                raise NoOptionError(section, key)
-        else:
+        elif section in ("builder", "translationtemplatesmanager"):
             return key
+        elif not self._overrides[section]:
+            raise NoSectionError(section)
+        else:
+            raise NoOptionError(section, key)
 
     def set(self, section, key, value):
         self._overrides[section][key] = value
@@ -108,9 +111,9 @@ class FakeBuilder:
         self._config = FakeConfig()
         self.waitingfiles = {}
         for fake_method in (
-                "emptyLog", "log",
+                "emptyLog", "log", "flushLog",
                 "chrootFail", "buildFail", "builderFail", "depFail", "buildOK",
-                "buildComplete", "sanitizeBuildlog",
+                "buildComplete", "notifyStatusChange",
                 ):
             setattr(self, fake_method, FakeMethod())
 
@@ -126,6 +129,21 @@ class FakeBuilder:
         shutil.copy(path, self.cachePath(sha1sum))
         self.waitingfiles[name] = sha1sum
 
+    def addWaitingFiles(self, paths, names=None):
+        paths = list(paths)
+        if names is None:
+            names = [None] * len(paths)
+        for path, name in zip(paths, names):
+            self.addWaitingFile(path, name=name)
+
+    def openCacheFile(self):
+        return CacheFileWriter(self._cachepath)
+
+    def addWaitingCacheFiles(self, writers):
+        for name, writer in writers.items():
+            os.rename(writer.path, self.cachePath(writer.sha1sum))
+            self.waitingfiles[name] = writer.sha1sum
+
     def anyMethod(self, *args, **kwargs):
         pass
 
@@ -224,6 +242,60 @@ class FakeBackend(Backend):
             for backend_path, (_, mode) in self.backend_fs.items()
             if match(backend_path, mode)]
 
+    def _stat(self, path):
+        def file_type(mode):
+            if stat.S_ISDIR(mode):
+                return "d"
+            elif stat.S_ISLNK(mode):
+                return "l"
+            else:
+                return "f"
+
+        contents, mode = self.backend_fs[path]
+        try:
+            _, target_mode = self._get_inode(path)
+            target_type = file_type(target_mode)
+        except KeyError:
+            target_type = "N"
+        return BackendStat(
+            file_type(mode), target_type,
+            len(contents) if contents is not None else 4096,
+            contents if stat.S_ISLNK(mode) else "")
+
+    def stat_many(self, paths):
+        return {
+            path: self._stat(path) if path in self.backend_fs else None
+            for path in paths}
+
+    def find_stat(self, path, max_depth=None, include_directories=True,
+                  name=None):
+        return {
+            entry: self._stat(os.path.join(path, entry))
+            for entry in self.find(
+                path, max_depth=max_depth,
+                include_directories=include_directories, name=name)}
+
+    def copy_out_to_sink(self, source_path, sink):
+        contents, _ = self._get_inode(source_path)
+        sink.write(contents)
+
+    def copy_out_tree_to_sinks(self, path, open_sink, filter=None,
+                               max_depth=None, follow_links=False):
+        entries = self.find_stat(
+            path, max_depth=max_depth, include_directories=False)
+        names = sorted(
+            entry for entry, entry_stat in entries.items()
+            if (entry_stat.target_type if follow_links
+                else entry_stat.type) == "f" and
+            (filter is None or filter(entry, entry_stat)))
+        for name in names:
+            sink = open_sink(name)
+            try:
+                self.copy_out_to_sink(os.path.join(path, name), sink)
+            finally:
+                sink.close()
+        return names
+
     def is_package_available(self, package):
         return package in self.available_packages
 
@@ -232,7 +304,7 @@ class UncontainedBackend(Backend):
     """A partial backend implementation with no containment."""
 
     def run(self, args, cwd=None, env=None, input_text=None, get_output=False,
-            echo=False, **kwargs):
+            echo=False, return_process=False, **kwargs):
         """See `Backend`."""
         if env:
             args = ["env"] + [
@@ -247,6 +319,8 @@ class UncontainedBackend(Backend):
                 kwargs["stdout"] = subprocess.PIPE
             proc = subprocess.Popen(
                 args, stdin=subprocess.PIPE, cwd=cwd, **kwargs)
+            if return_process:
+                return proc
             output, _ = proc.communicate(input_text)
             if proc.returncode:
                 raise subprocess.CalledProcessError(proc.returncode, args)
@@ -31,11 +31,15 @@ class MockBuildManager(object):
     Only implements 'is_archive_private' and 'needs_sanitized_logs' as False.
     """
     is_archive_private = False
+    cache_files = frozenset()
 
     @property
     def needs_sanitized_logs(self):
         return self.is_archive_private
 
+    def stopTargetHelper(self):
+        pass
+
 
 class BuilddTestCase(unittest.TestCase):
     """Unit tests for logtail mechanisms."""
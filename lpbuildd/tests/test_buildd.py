@@ -25,6 +25,7 @@ import unittest
 from six.moves.urllib.request import HTTPBasicAuthHandler
 from six.moves.xmlrpc_client import ServerProxy
 import twisted
+from twisted.internet import task
 
 from lpbuildd.tests.harness import (
     BuilddTestCase,
@@ -67,23 +68,24 @@ class LaunchpadBuilddTests(BuilddTestCase):
 
     def testBuildlogScrubbing(self):
         """Tests the buildlog scrubbing (removal of passwords from URLs)."""
-        # This is where the buildlog file lives.
-        log_path = self.builder.cachePath('buildlog')
-
-        # This is where the builder leaves the original/unsanitized
-        # buildlog file after scrubbing.
-        unsanitized_path = self.builder.cachePath('buildlog.unsanitized')
-
-        # Copy the fake buildlog file to the cache path.
-        shutil.copy(os.path.join(self.here, 'buildlog'), log_path)
-
-        # Invoke the builder's buildlog scrubbing method.
-        self.builder.sanitizeBuildlog(log_path)
+        # Write the fake buildlog to the builder in small chunks, as the
+        # output of a build in a private archive would arrive, so that
+        # some URLs are split across chunks.
+        self.builder._log = None
+        self.builder._reactor = task.Clock()
+        self.builder.manager.is_archive_private = True
+        self.builder.emptyLog()
+        self.addCleanup(self.builder._log.close)
+        with open(os.path.join(self.here, 'buildlog'), 'rb') as f:
+            data = f.read()
+        for i in range(0, len(data), 37):
+            self.builder.log(data[i:i + 37])
+        self.builder.flushLog(partial_lines=True)
 
         # Read the unsanitized original content.
-        unsanitized = read_file(unsanitized_path).splitlines()
+        unsanitized = data.decode('UTF-8').splitlines()
         # Read the new, sanitized content.
-        clean = read_file(log_path).splitlines()
+        clean = read_file(self.builder.cachePath('buildlog')).splitlines()
 
         # Compare the scrubbed content with the unsanitized one.
         differences = '\n'.join(difflib.unified_diff(unsanitized, clean))
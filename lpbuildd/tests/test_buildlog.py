@@ -0,0 +1,283 @@
+# Copyright 2026 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+__metaclass__ = type
+
+import gzip
+import io
+import os
+from random import Random
+import zlib
+
+from fixtures import TempDir
+from testtools import TestCase
+from twisted.internet import task
+from twisted.web.test.requesthelper import DummyRequest
+
+from lpbuildd.buildlog import (
+    BufferedLogWriter,
+    CompressedLogResource,
+    GzipLogFile,
+    LogSanitizer,
+    LogTail,
+    open_build_log,
+    read_build_log_tail,
+    )
+
+
+class TestBufferedLogWriter(TestCase):
+
+    def setUp(self):
+        super(TestBufferedLogWriter, self).setUp()
+        self.clock = task.Clock()
+        self.file = io.BytesIO()
+        self.writer = BufferedLogWriter(
+            self.file, flush_size=10, flush_interval=1.0, reactor=self.clock)
+
+    def test_buffers_small_writes(self):
+        self.writer.write(b"abc")
+        self.writer.write(b"def")
+        self.assertEqual(b"", self.file.getvalue())
+        self.writer.flush()
+        self.assertEqual(b"abcdef", self.file.getvalue())
+
+    def test_flushes_on_size(self):
+        self.writer.write(b"abcdef")
+        self.writer.write(b"ghijkl")
+        self.assertEqual(b"abcdefghijkl", self.file.getvalue())
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_flushes_on_interval(self):
+        self.writer.write(b"abc")
+        self.clock.advance(0.5)
+        self.writer.write(b"def")
+        self.assertEqual(b"", self.file.getvalue())
+        self.clock.advance(0.5)
+        self.assertEqual(b"abcdef", self.file.getvalue())
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_close_flushes(self):
+        self.writer.write(b"abc")
+        written = []
+        self.file.close = lambda: written.append(self.file.getvalue())
+        self.writer.close()
+        self.assertEqual([b"abc"], written)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+
+class TestLogTail(TestCase):
+
+    def test_keeps_most_recent_bytes(self):
+        tail = LogTail(size=8)
+        self.assertEqual(b"", tail.getvalue())
+        tail.append(b"abc")
+        tail.append(b"def")
+        self.assertEqual(b"abcdef", tail.getvalue())
+        tail.append(b"ghi")
+        self.assertEqual(b"bcdefghi", tail.getvalue())
+        tail.append(b"0123456789")
+        self.assertEqual(b"23456789", tail.getvalue())
+
+
+class TestLogSanitizer(TestCase):
+
+    def setUp(self):
+        super(TestLogSanitizer, self).setUp()
+        self.sanitizer = LogSanitizer(
+            lambda data: data.replace(b"secret", b""),
+            max_carry=16, overlap=8)
+
+    def test_complete_lines(self):
+        self.assertEqual(
+            b"a \nb \n", self.sanitizer.feed(b"a secret\nb secret\n"))
+        self.assertEqual(b"", self.sanitizer.finish())
+
+    def test_carries_over_partial_lines(self):
+        self.assertEqual(b"a \n", self.sanitizer.feed(b"a secret\nb sec"))
+        self.assertEqual(b"b \n", self.sanitizer.feed(b"ret\nc sec"))
+        self.assertEqual(b"c sec", self.sanitizer.finish())
+
+    def test_bounded_carry(self):
+        self.assertEqual(b"", self.sanitizer.feed(b"x" * 10))
+        # The last `overlap` bytes are still carried over.
+        self.assertEqual(b"x" * 12, self.sanitizer.feed(b"x" * 10))
+        self.assertEqual(b"x" * 8, self.sanitizer.finish())
+
+    def test_bounded_carry_splits_at_whitespace(self):
+        self.assertEqual(b"aaaa ", self.sanitizer.feed(b"aaaa bbbb cccc dd"))
+        self.assertEqual(b"bbbb cccc dd", self.sanitizer.finish())
+
+    def test_bounded_carry_keeps_urls_whole(self):
+        self.assertEqual(b"abcd", self.sanitizer.feed(b"abcd://efghijklmnopq"))
+        self.assertEqual(b"://efghijklmnopq", self.sanitizer.finish())
+
+    def test_bounded_carry_credential_split_across_chunks(self):
+        self.assertEqual(
+            b"x" * 10, self.sanitizer.feed(b"x" * 12 + b"://sec"))
+        self.assertEqual(b"xx://@h\n", self.sanitizer.feed(b"ret@h\n"))
+
+
+class TestGzipLog(TestCase):
+
+    def setUp(self):
+        super(TestGzipLog, self).setUp()
+        self.path = self.useFixture(TempDir()).path
+        self.log_path = os.path.join(self.path, "buildlog.gz")
+
+    def makeRealisticLog(self):
+        # Varied build output, which (unlike repetitive test data) is
+        # sensitive to how often the compressor is flushed.
+        random = Random(1)
+        lines = []
+        for i in range(10000):
+            kind = i % 4
+            if kind == 0:
+                lines.append(
+                    b"Get:%d http://ftpmaster.internal/ubuntu focal/main "
+                    b"amd64 libfoo%d amd64 1.%d-%d [%d kB]\n" % (
+                        i, random.randrange(500), random.randrange(10),
+                        random.randrange(10), random.randrange(2000)))
+            elif kind == 1:
+                module = random.randrange(50)
+                name = random.randrange(50)
+                lines.append(
+                    b"gcc -DHAVE_CONFIG_H -I. -I.. -O2 -g -Wall "
+                    b"-c src/mod%d/file%d.c -o src/mod%d/file%d.o\n" % (
+                        module, name, module, name))
+            elif kind == 2:
+                lines.append(
+                    b"Setting up libbar%d:amd64 (2.%d-%dubuntu%d) ...\n" % (
+                        random.randrange(300), random.randrange(10),
+                        random.randrange(10), random.randrange(3)))
+            else:
+                lines.append(
+                    b"PASS: test-%d (%.3fs)\n" % (
+                        random.randrange(1000), random.random()))
+        return b"".join(lines)
+
+    def test_readable_while_writing(self):
+        log = GzipLogFile(open(self.log_path, "wb"), reactor=task.Clock())
+        self.addCleanup(log.close)
+        log.write(b"first\n")
+        log.sync()
+        log.write(b"unsynced\n")
+        log.flush()
+        with open_build_log(self.path) as reader:
+            self.assertEqual(b"first\n", reader.read())
+
+    def test_finish(self):
+        log = GzipLogFile(open(self.log_path, "wb"), reactor=task.Clock())
+        self.addCleanup(log.close)
+        log.write(b"first\n")
+        log.finish()
+        with gzip.open(self.log_path, "rb") as f:
+            self.assertEqual(b"first\n", f.read())
+        # Later writes start a new gzip member.
+        log.write(b"second\n")
+        log.sync()
+        with open_build_log(self.path) as reader:
+            self.assertEqual(b"first\nsecond\n", reader.read())
+        log.close()
+        with gzip.open(self.log_path, "rb") as f:
+            self.assertEqual(b"first\nsecond\n", f.read())
+
+    def test_reader_crosses_members(self):
+        log = GzipLogFile(open(self.log_path, "wb"), reactor=task.Clock())
+        log.write(b"a" * 100)
+        log.finish()
+        log.write(b"b" * 100)
+        log.close()
+        with open_build_log(self.path) as reader:
+            self.assertEqual(b"a" * 90, reader.read(90))
+            self.assertEqual(b"a" * 10 + b"b" * 100, reader.read())
+
+    def test_flush_syncs_occasionally(self):
+        clock = task.Clock()
+        log = GzipLogFile(
+            open(self.log_path, "wb"), sync_interval=60, reactor=clock)
+        self.addCleanup(log.close)
+        log.write(b"first\n")
+        clock.advance(59)
+        log.flush()
+        with open_build_log(self.path) as reader:
+            self.assertEqual(b"", reader.read())
+        clock.advance(1)
+        log.flush()
+        with open_build_log(self.path) as reader:
+            self.assertEqual(b"first\n", reader.read())
+
+    def test_compression_ratio(self):
+        # Flushing frequently, as BufferedLogWriter does, compresses about
+        # as well as compressing the whole log at once.
+        data = self.makeRealisticLog()
+        log = BufferedLogWriter(
+            GzipLogFile(open(self.log_path, "wb"), reactor=task.Clock()),
+            flush_size=1024, reactor=task.Clock())
+        for i in range(0, len(data), 200):
+            log.write(data[i:i + 200])
+        log.close()
+        with gzip.open(self.log_path, "rb") as f:
+            self.assertEqual(data, f.read())
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        whole_size = len(compressor.compress(data) + compressor.flush())
+        self.assertLess(
+            os.path.getsize(self.log_path), whole_size * 1.01)
+
+    def test_sync_through_buffered_writer(self):
+        log = BufferedLogWriter(
+            GzipLogFile(open(self.log_path, "wb"), reactor=task.Clock()),
+            reactor=task.Clock())
+        self.addCleanup(log.close)
+        log.write(b"line\n")
+        log.sync()
+        with open_build_log(self.path) as reader:
+            self.assertEqual(b"line\n", reader.read())
+
+    def test_close_finishes_stream(self):
+        log = GzipLogFile(open(self.log_path, "wb"))
+        log.write(b"line\n" * 1000)
+        log.close()
+        with gzip.open(self.log_path, "rb") as f:
+            self.assertEqual(b"line\n" * 1000, f.read())
+
+    def test_read_build_log_tail(self):
+        log = GzipLogFile(open(self.log_path, "wb"))
+        log.write(os.urandom(200000))
+        log.write(b"the end")
+        log.close()
+        self.assertEqual(b"end", read_build_log_tail(self.path, 3))
+
+    def test_read_build_log_tail_uncompressed(self):
+        with open(os.path.join(self.path, "buildlog"), "wb") as f:
+            f.write(b"abcdef")
+        self.assertEqual(b"def", read_build_log_tail(self.path, 3))
+        self.assertEqual(b"abcdef", read_build_log_tail(self.path, 4096))
+
+
+class TestCompressedLogResource(TestCase):
+
+    def setUp(self):
+        super(TestCompressedLogResource, self).setUp()
+        self.log_path = os.path.join(
+            self.useFixture(TempDir()).path, "buildlog.gz")
+        log = GzipLogFile(open(self.log_path, "wb"))
+        log.write(b"log contents\n")
+        log.close()
+
+    def test_gzip(self):
+        request = DummyRequest([])
+        request.requestHeaders.addRawHeader(b"Accept-Encoding", b"gzip")
+        CompressedLogResource(self.log_path).render(request)
+        self.assertEqual(
+            [b"gzip"],
+            request.responseHeaders.getRawHeaders(b"Content-Encoding"))
+        with open(self.log_path, "rb") as f:
+            self.assertEqual(f.read(), b"".join(request.written))
+
+    def test_decompresses(self):
+        request = DummyRequest([])
+        CompressedLogResource(self.log_path).render(request)
+        self.assertIsNone(
+            request.responseHeaders.getRawHeaders(b"Content-Encoding"))
+        self.assertEqual(b"log contents\n", b"".join(request.written))
+        self.assertEqual(1, request.finished)
@@ -143,6 +143,9 @@ class TestCIBuildManagerIteration(TestCase):
         self.buildmanager.backend.add_file(
             "/build/output/test:0/ci.tar.gz",
             b"I am output from a CI test job.")
+        # Symbolic links in the output are ignored.
+        self.buildmanager.backend.add_link(
+            "/build/output/test:0/link.tar.gz", "ci.tar.gz")
 
         # Output from the first job is visible in the status response.
         extra_status = self.buildmanager.status()
@@ -157,6 +160,8 @@ class TestCIBuildManagerIteration(TestCase):
                     },
                 },
             extra_status["jobs"])
+        # The status is not rebuilt until something changes.
+        self.assertIs(extra_status, self.buildmanager.status())
 
         # After running the final job, reap processes.
         yield self.buildmanager.iterate(0)
@@ -230,6 +235,43 @@ class TestCIBuildManagerIteration(TestCase):
             self.buildmanager.home, self.buildmanager._buildid))
         self.assertIn("jobs", self.buildmanager.status())
 
+    @defer.inlineCallbacks
+    def test_iterate_dangling_log(self):
+        # A dangling symbolic link in place of a CI job's log is ignored.
+        args = {
+            "git_repository": "https://git.launchpad.test/~example/+git/ci",
+            "git_path": "main",
+            "jobs": [[("build", "0")]],
+            }
+        expected_options = [
+            "--git-repository", "https://git.launchpad.test/~example/+git/ci",
+            "--git-path", "main",
+            ]
+        yield self.startBuild(args, expected_options)
+
+        yield self.expectRunJob("build", "0")
+        self.buildmanager.backend.add_link(
+            "/build/output/build:0.log", "nonexistent.log")
+        self.buildmanager.backend.add_file(
+            "/build/output/build:0/ci.whl",
+            b"I am output from a CI build job.")
+
+        yield self.buildmanager.iterate(0)
+        self.assertFalse(self.builder.wasCalled("buildFail"))
+        self.assertThat(self.builder, HasWaitingFiles.byEquality({
+            "build:0/ci.whl": b"I am output from a CI build job.",
+            }))
+        self.assertEqual(
+            {
+                "build:0": {
+                    "output": {
+                        "ci.whl": self.builder.waitingfiles["build:0/ci.whl"],
+                        },
+                    "result": RESULT_SUCCEEDED,
+                    },
+                },
+            self.buildmanager.status()["jobs"])
+
     @defer.inlineCallbacks
     def test_iterate_failure(self):
         # The build manager records CI jobs that fail.
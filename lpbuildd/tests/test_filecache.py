@@ -0,0 +1,256 @@
+# Copyright 2026 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+__metaclass__ = type
+
+import hashlib
+import os
+import sqlite3
+
+from fixtures import TempDir
+from testtools import TestCase
+from twisted.web import resource
+from twisted.web.test.requesthelper import DummyRequest
+
+from lpbuildd.buildlog import CompressedLogResource
+from lpbuildd.filecache import (
+    CacheFileWriter,
+    FileCache,
+    FileCacheResource,
+    parse_size,
+    )
+
+
+class TestParseSize(TestCase):
+
+    def test_bytes(self):
+        self.assertEqual(1000, parse_size("1000"))
+
+    def test_suffixes(self):
+        self.assertEqual(2048, parse_size("2K"))
+        self.assertEqual(3 * 1024 ** 2, parse_size("3M"))
+        self.assertEqual(4 * 1024 ** 3, parse_size(" 4g "))
+        self.assertEqual(1024 ** 4, parse_size("1T"))
+
+
+class TestCacheFileWriter(TestCase):
+
+    def setUp(self):
+        super(TestCacheFileWriter, self).setUp()
+        self.path = self.useFixture(TempDir()).path
+
+    def test_write(self):
+        writer = CacheFileWriter(self.path)
+        writer.write(b"some ")
+        writer.write(b"data")
+        writer.close()
+        self.assertTrue(writer.closed)
+        self.assertEqual(self.path, os.path.dirname(writer.path))
+        with open(writer.path, "rb") as f:
+            self.assertEqual(b"some data", f.read())
+        self.assertEqual(
+            hashlib.sha1(b"some data").hexdigest(), writer.sha1sum)
+        self.assertEqual(
+            hashlib.sha256(b"some data").hexdigest(), writer.sha256sum)
+
+    def test_mode(self):
+        # New files get the usual permissions for the umask, rather than
+        # tempfile.mkstemp's 0600.
+        self.addCleanup(os.umask, os.umask(0o022))
+        writer = CacheFileWriter(self.path)
+        writer.close()
+        self.assertEqual(0o644, os.stat(writer.path).st_mode & 0o777)
+
+    def test_discard(self):
+        writer = CacheFileWriter(self.path)
+        writer.write(b"data")
+        writer.discard()
+        self.assertTrue(writer.closed)
+        self.assertEqual([], os.listdir(self.path))
+
+
+class TestFileCache(TestCase):
+
+    def setUp(self):
+        super(TestFileCache, self).setUp()
+        self.path = self.useFixture(TempDir()).path
+
+    def makeFile(self, name, size, mtime=None):
+        path = os.path.join(self.path, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return name
+
+    def test_scan(self):
+        self.makeFile("a" * 40, 10)
+        self.makeFile("b" * 40, 20)
+        self.makeFile("buildlog", 100)
+        self.makeFile("c" * 40 + ".tmp", 100)
+        cache = FileCache(self.path)
+        self.assertIn("a" * 40, cache)
+        self.assertNotIn("buildlog", cache)
+        self.assertEqual(30, cache.total_size)
+
+    def test_add_remove(self):
+        cache = FileCache(self.path)
+        name = self.makeFile("a" * 40, 10)
+        cache.add(name)
+        self.assertEqual(10, cache.total_size)
+        cache.remove(name)
+        self.assertEqual(0, cache.total_size)
+        self.assertEqual([], os.listdir(self.path))
+
+    def test_no_quota(self):
+        self.makeFile("a" * 40, 10)
+        cache = FileCache(self.path)
+        self.assertEqual([], cache.evict())
+        self.assertEqual(["a" * 40], os.listdir(self.path))
+
+    def test_evict_lru(self):
+        self.makeFile("a" * 40, 10, mtime=1000)
+        self.makeFile("b" * 40, 10, mtime=2000)
+        self.makeFile("c" * 40, 10, mtime=3000)
+        cache = FileCache(self.path, quota=25)
+        # Using a file makes it the most recently used one.
+        cache.touch("a" * 40)
+        self.assertEqual(["b" * 40], cache.evict())
+        self.assertEqual(
+            ["a" * 40, "c" * 40], sorted(os.listdir(self.path)))
+        self.assertEqual(20, cache.total_size)
+
+    def test_evict_pinned(self):
+        self.makeFile("a" * 40, 10, mtime=1000)
+        self.makeFile("b" * 40, 10, mtime=2000)
+        self.makeFile("c" * 40, 10, mtime=3000)
+        cache = FileCache(self.path, quota=15)
+        self.assertEqual(
+            ["b" * 40, "c" * 40], cache.evict(pinned={"a" * 40}))
+        self.assertEqual(["a" * 40], os.listdir(self.path))
+
+    def test_touch_survives_rescan(self):
+        self.makeFile("a" * 40, 10, mtime=1000)
+        self.makeFile("b" * 40, 10, mtime=2000)
+        cache = FileCache(self.path, quota=15)
+        cache.touch("a" * 40)
+        cache = FileCache(self.path, quota=15)
+        self.assertEqual(["b" * 40], cache.evict())
+
+    def test_isPresent(self):
+        cache = FileCache(self.path)
+        self.assertFalse(cache.isPresent("a" * 40))
+        # Files placed in the cache behind our back are adopted.
+        self.makeFile("a" * 40, 10)
+        self.assertTrue(cache.isPresent("a" * 40))
+        self.assertEqual(10, cache.total_size)
+        os.remove(os.path.join(self.path, "a" * 40))
+        self.assertFalse(cache.isPresent("a" * 40))
+        self.assertEqual(0, cache.total_size)
+
+
+class TestFileCacheIndex(TestCase):
+
+    def setUp(self):
+        super(TestFileCacheIndex, self).setUp()
+        self.path = self.useFixture(TempDir()).path
+        self.index_path = os.path.join(self.path, ".index.sqlite")
+
+    def makeFile(self, name, contents):
+        with open(os.path.join(self.path, name), "wb") as f:
+            f.write(contents)
+        return name
+
+    def test_persists(self):
+        name = self.makeFile("a" * 40, b"data")
+        cache = FileCache(self.path, index_path=self.index_path)
+        cache.add(name, sha256="1" * 64, url="http://example.org/a")
+        cache = FileCache(self.path, index_path=self.index_path)
+        entry = cache.entries()[name]
+        self.assertEqual(4, entry.size)
+        self.assertEqual("1" * 64, entry.sha256)
+        self.assertEqual("http://example.org/a", entry.url)
+
+    def test_scan_verifies(self):
+        a = self.makeFile("a" * 40, b"data")
+        b = self.makeFile("b" * 40, b"data")
+        cache = FileCache(self.path, index_path=self.index_path)
+        cache.add(a, sha256="1" * 64)
+        cache.add(b, sha256="2" * 64)
+        # Missing files are dropped from the index, files that have changed
+        # size lose their recorded details, and new files are added.
+        os.remove(os.path.join(self.path, a))
+        self.makeFile(b, b"changed")
+        c = self.makeFile("c" * 40, b"new")
+        cache = FileCache(self.path, index_path=self.index_path)
+        entries = cache.entries()
+        self.assertEqual([b, c], sorted(entries))
+        self.assertEqual(7, entries[b].size)
+        self.assertIsNone(entries[b].sha256)
+        self.assertEqual(3, entries[c].size)
+        cache = FileCache(self.path, index_path=self.index_path)
+        self.assertEqual([b, c], sorted(cache.entries()))
+
+    def test_evict_updates_index(self):
+        self.makeFile("a" * 40, b"data")
+        cache = FileCache(self.path, quota=0, index_path=self.index_path)
+        self.assertEqual(["a" * 40], cache.evict())
+        cache = FileCache(self.path, index_path=self.index_path)
+        self.assertEqual({}, cache.entries())
+
+    def getIndexedAccessTime(self, name):
+        index = sqlite3.connect(self.index_path)
+        try:
+            [(last_access,)] = index.execute(
+                "SELECT last_access FROM files WHERE sha1 = ?", (name,))
+        finally:
+            index.close()
+        return last_access
+
+    def test_touch_saved_on_evict(self):
+        # Access times are written to the index in batches.
+        name = self.makeFile("a" * 40, b"data")
+        os.utime(os.path.join(self.path, name), (1000, 1000))
+        cache = FileCache(self.path, index_path=self.index_path)
+        self.assertEqual(1000, self.getIndexedAccessTime(name))
+        cache.touch(name)
+        self.assertEqual(1000, self.getIndexedAccessTime(name))
+        self.assertEqual([], cache.evict())
+        self.assertEqual(
+            cache.entries()[name].last_access,
+            self.getIndexedAccessTime(name))
+        self.assertGreater(self.getIndexedAccessTime(name), 1000)
+
+    def test_touch_then_remove(self):
+        name = self.makeFile("a" * 40, b"data")
+        cache = FileCache(self.path, index_path=self.index_path)
+        cache.touch(name)
+        cache.remove(name)
+        self.assertEqual([], cache.evict())
+        self.assertEqual({}, FileCache(
+            self.path, index_path=self.index_path).entries())
+
+
+class TestFileCacheResource(TestCase):
+
+    def test_hides_dotfiles(self):
+        path = self.useFixture(TempDir()).path
+        for name in ("a" * 40, ".index.sqlite"):
+            with open(os.path.join(path, name), "w"):
+                pass
+        root = FileCacheResource(path)
+        self.assertEqual(["a" * 40], root.listNames())
+        self.assertIsInstance(
+            root.getChild(b".index.sqlite", DummyRequest([])),
+            resource.NoResource)
+        self.assertIsInstance(
+            root.getChild(b"a" * 40, DummyRequest([])), FileCacheResource)
+
+    def test_compressed_buildlog(self):
+        path = self.useFixture(TempDir()).path
+        with open(os.path.join(path, "buildlog.gz"), "wb"):
+            pass
+        root = FileCacheResource(path)
+        self.assertIsInstance(
+            root.getChild(b"buildlog", DummyRequest([])),
+            CompressedLogResource)
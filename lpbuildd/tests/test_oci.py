@@ -189,6 +189,48 @@ class TestOCIBuildManagerIteration(TestCase):
             self.buildmanager.iterate, self.buildmanager.iterators[-1])
         self.assertFalse(self.builder.wasCalled("buildFail"))
 
+    @defer.inlineCallbacks
+    def test_iterate_metadata_symlink(self):
+        # Symbolic links to files in the metadata directory are followed.
+        sha_mock = self.useFixture(
+            MockPatch('lpbuildd.oci.OCIBuildManager._calculateLayerSha'))
+        sha_mock.mock.return_value = "testsha"
+        args = {
+            "git_repository": "https://git.launchpad.dev/~example/+git/snap",
+            "git_path": "master",
+            }
+        expected_options = [
+            "--git-repository", "https://git.launchpad.dev/~example/+git/snap",
+            "--git-path", "master",
+            ]
+        yield self.startBuild(args, expected_options)
+
+        log_path = os.path.join(self.buildmanager._cachepath, "buildlog")
+        with open(log_path, "w") as log:
+            log.write("I am a build log.")
+
+        self.buildmanager.backend.run.result = MockOCITarSave()
+
+        self.buildmanager.backend.add_file(
+            '/var/lib/docker/image/vfs/distribution/diff1',
+            b"""[{"Digest": "test_digest", "SourceRepository": "test"}]""")
+        self.buildmanager.backend.add_link(
+            '/var/lib/docker/image/'
+            'vfs/distribution/v2metadata-by-diffid/sha256/diff1',
+            '../../diff1')
+
+        yield self.buildmanager.iterate(0)
+        self.assertEqual(OCIBuildState.BUILD_OCI, self.getState())
+        self.assertFalse(self.builder.wasCalled("buildFail"))
+        cache_path = self.builder.cachePath(
+            self.builder.waitingfiles['digests.json'])
+        with open(cache_path) as f:
+            digests = json.load(f)
+        self.assertEqual(
+            {"source": "test", "digest": "test_digest",
+             "layer_id": "layer-1"},
+            digests[0]["sha256:diff1"])
+
     @defer.inlineCallbacks
     def test_iterate_with_file_and_args(self):
         # This sha would change as it includes file attributes in the
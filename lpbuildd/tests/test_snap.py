@@ -119,6 +119,20 @@ class TestSnapBuildManagerIteration(TestCase):
             status_file.write('{"revision_id": "dummy"}')
         self.assertEqual({"revision_id": "dummy"}, self.buildmanager.status())
 
+    def test_status_cached(self):
+        # The status file is only read again if it has been replaced.
+        status_path = os.path.join(
+            self.working_dir, "home", "build-%s" % self.buildid, "status")
+        os.makedirs(os.path.dirname(status_path))
+        with open(status_path, "w") as status_file:
+            status_file.write('{"revision_id": "dummy"}')
+        status = self.buildmanager.status()
+        self.assertIs(status, self.buildmanager.status())
+        with open("%s.tmp" % status_path, "w") as status_file:
+            status_file.write('{"revision_id": "other"}')
+        os.rename("%s.tmp" % status_path, status_path)
+        self.assertEqual({"revision_id": "other"}, self.buildmanager.status())
+
     @defer.inlineCallbacks
     def test_iterate(self):
         # The build manager iterates a normal build from start to finish.
@@ -393,6 +407,39 @@ class TestSnapBuildManagerIteration(TestCase):
             self.buildmanager.iterate, self.buildmanager.iterators[-1])
         self.assertFalse(self.builder.wasCalled("buildFail"))
 
+    @defer.inlineCallbacks
+    def test_iterate_with_dangling_source_tarball(self):
+        # A dangling symbolic link in place of the source tarball is
+        # ignored.
+        args = {
+            "git_repository": "https://git.launchpad.dev/~example/+git/snap",
+            "git_path": "master",
+            "build_source_tarball": True,
+            }
+        expected_options = [
+            "--git-repository", "https://git.launchpad.dev/~example/+git/snap",
+            "--git-path", "master",
+            "--build-source-tarball",
+            ]
+        yield self.startBuild(args, expected_options)
+
+        log_path = os.path.join(self.buildmanager._cachepath, "buildlog")
+        with open(log_path, "w") as log:
+            log.write("I am a build log.")
+
+        self.buildmanager.backend.add_file(
+            "/build/test-snap/test-snap_0_all.snap", b"I am a snap package.")
+        self.buildmanager.backend.add_link(
+            "/build/test-snap.tar.gz", "nonexistent.tar.gz")
+
+        # After building the package, reap processes.
+        yield self.buildmanager.iterate(0)
+        self.assertEqual(SnapBuildState.BUILD_SNAP, self.getState())
+        self.assertFalse(self.builder.wasCalled("buildFail"))
+        self.assertThat(self.builder, HasWaitingFiles.byEquality({
+            "test-snap_0_all.snap": b"I am a snap package.",
+            }))
+
     @defer.inlineCallbacks
     def test_iterate_private(self):
         # The build manager iterates a private build from start to finish.
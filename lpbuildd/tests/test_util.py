@@ -3,10 +3,14 @@
 
 __metaclass__ = type
 
+import os
+
+from fixtures import TempDir
 from testtools import TestCase
 
 from lpbuildd.util import (
     get_arch_bits,
+    get_installed_version,
     set_personality,
     shell_escape,
     )
@@ -30,6 +34,52 @@ class TestShellEscape(TestCase):
             shell_escape(u"\N{SNOWMAN}".encode("UTF-8")))
 
 
+class TestGetInstalledVersion(TestCase):
+
+    def makeStatus(self, text):
+        path = os.path.join(self.useFixture(TempDir()).path, "status")
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_installed(self):
+        path = self.makeStatus(
+            "Package: launchpad-buildd-extra\n"
+            "Status: install ok installed\n"
+            "Version: 1\n"
+            "\n"
+            "Package: launchpad-buildd\n"
+            "Status: install ok installed\n"
+            "Description: Launchpad buildd slave\n"
+            " Continuation: line\n"
+            "Version: 207\n"
+            "\n"
+            "Package: other\n"
+            "Version: 2\n")
+        self.assertEqual(
+            "207", get_installed_version("launchpad-buildd", path))
+
+    def test_last_paragraph(self):
+        path = self.makeStatus(
+            "Package: launchpad-buildd\n"
+            "Status: install ok installed\n"
+            "Version: 207\n")
+        self.assertEqual(
+            "207", get_installed_version("launchpad-buildd", path))
+
+    def test_not_installed(self):
+        path = self.makeStatus(
+            "Package: launchpad-buildd\n"
+            "Status: deinstall ok config-files\n"
+            "Version: 207\n")
+        self.assertIsNone(get_installed_version("launchpad-buildd", path))
+        self.assertIsNone(get_installed_version("nonexistent", path))
+
+    def test_missing_status_file(self):
+        self.assertIsNone(get_installed_version(
+            "launchpad-buildd", "/nonexistent/status"))
+
+
 class TestGetArchBits(TestCase):
 
     def test_x32(self):
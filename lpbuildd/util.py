@@ -3,6 +3,7 @@
 
 __metaclass__ = type
 
+import io
 import os
 try:
     from shlex import quote
@@ -22,7 +23,17 @@ def shell_escape(s):
         return quote(s)
 
 
+# Memoized results of get_arch_bits.
+_arch_bits = {}
+
+
 def get_arch_bits(arch):
+    if arch not in _arch_bits:
+        _arch_bits[arch] = _get_arch_bits(arch)
+    return _arch_bits[arch]
+
+
+def _get_arch_bits(arch):
     if arch == "x32":
         # x32 is an exception: the userspace is 32-bit, but it expects to be
         # running on a 64-bit kernel.
@@ -43,6 +54,36 @@ def get_arch_bits(arch):
                 "(DEB_HOST_ARCH_BITS=%s)" % (arch, bits))
 
 
+def get_installed_version(package, status_path="/var/lib/dpkg/status"):
+    """Return the installed version of a package, or None.
+
+    This reads dpkg's status database directly, which is much cheaper
+    than building an apt cache.
+    """
+    fields = {}
+
+    def installed_version():
+        status = fields.get("Status", "").split()
+        if fields.get("Package") == package and status[-1:] == ["installed"]:
+            return fields.get("Version")
+
+    try:
+        status_file = io.open(status_path, encoding="UTF-8", errors="replace")
+    except IOError:
+        return None
+    with status_file:
+        for line in status_file:
+            if not line.strip():
+                version = installed_version()
+                if version is not None:
+                    return version
+                fields = {}
+            elif not line[0].isspace() and ":" in line:
+                key, value = line.split(":", 1)
+                fields[key] = value.strip()
+    return installed_version()
+
+
 def set_personality(args, arch, series=None):
     bits = get_arch_bits(arch)
     assert bits in (32, 64)